@@ -1,16 +1,26 @@
 import os
-import sys
-import shutil
-import subprocess
 import base64
+import threading
 import streamlit as st
 import streamlit.components.v1 as components
 from streamlit_drawable_canvas import st_canvas
 from PIL import Image, ImageOps, ImageDraw
 import numpy as np
+import cv2
 from io import BytesIO
 import pandas as pd
 
+import metrics
+import models
+import render
+import score_cache
+import st_sample
+import table_sinks
+import video_stream
+import workspace
+from artifacts import ArtifactSink
+from pipeline import OCRPipeline, table_rows
+
 # =====================================================
 # BASE PATH
 # =====================================================
@@ -132,10 +142,37 @@ if IS_MOBILE:
     """, unsafe_allow_html=True)
 
 # =====================================================
-# ROI DIRECTORY
+# JOBS
+# =====================================================
+JOB_SLOT_TIMEOUT = 120   # seconds to wait for a free pipeline slot
+
+# =====================================================
+# MODELS (loaded + warmed up once per server process)
 # =====================================================
-ROI_DIR = "sample"
-os.makedirs(ROI_DIR, exist_ok=True)
+@st.cache_resource(show_spinner="Loading CRAFT + PaddleOCR...")
+def load_models():
+    return models.get_default_craft(), models.get_ocr()
+
+
+@st.cache_resource
+def load_score_store():
+    return score_cache.ScoreMapStore()
+
+
+def get_pipeline():
+    net, ocr = load_models()
+    return OCRPipeline(net=net, ocr=ocr, score_store=load_score_store())
+
+
+def close_sink(sink):
+    """ Drains an ArtifactSink off the script thread; failures only reach the log. """
+    try:
+        sink.close()
+    except Exception as e:
+        print(f"⚠️ Writing artifacts of {sink.base_dir} failed: {e}")
+
+
+load_models()
 
 # =====================================================
 # SIDEBAR
@@ -165,6 +202,36 @@ with st.sidebar:
     strip_thickness_pct = st.slider("Strip thickness (%)", 8, 60, 22)
     strip_pos_pct = st.slider("Strip position (%)", 0, 100, 50)
 
+    st.subheader("Output")
+    save_artifacts = st.checkbox("Save ROI / crop / OCR artifacts to disk", False)
+
+    # re-thresholds the CRAFT score maps of the last run's ROIs (stored on first preview)
+    st.subheader("Detection thresholds (preview)")
+    preview_text = st.slider("Text threshold", 0.05, 0.95, st_sample.TEXT_THRESHOLD, 0.01)
+    preview_link = st.slider("Link threshold", 0.05, 0.95, st_sample.LINK_THRESHOLD, 0.01)
+    preview_low = st.slider("Low text", 0.05, 0.95, st_sample.LOW_TEXT, 0.01)
+
+    # process-wide counters (all sessions), as of this rerun
+    with st.expander("Metrics"):
+        stage_rows = metrics.summary()
+        if stage_rows:
+            st.dataframe(pd.DataFrame(stage_rows).set_index("stage"), width="stretch")
+        else:
+            st.caption("No runs yet")
+
+        items = metrics.ITEMS_TOTAL.snapshot()
+        if items:
+            st.caption(" · ".join(f"{n} {kind}" for kind, n in sorted(items.items())))
+
+        peak_rss = metrics.peak_rss_bytes()
+        if peak_rss is not None:
+            st.caption(f"Peak RSS: {peak_rss / 2**20:.0f} MB")
+
+        for name, stats in sorted(metrics.cache_stats().items()):
+            rate = metrics.hit_rate(stats)
+            if rate is not None:
+                st.caption(f"{name}: {rate:.0%} hits ({stats['hits']}/{stats['hits'] + stats['misses']})")
+
 # =====================================================
 # IMAGE SOURCE
 # =====================================================
@@ -172,10 +239,57 @@ st.subheader("Select Image Source")
 
 image_source = st.radio(
     "Choose input method:",
-    ["Upload Image", "Capture from Camera"],
+    ["Upload Image", "Capture from Camera", "Video Stream"],
     horizontal=True
 )
 
+# =====================================================
+# VIDEO STREAM MODE (scanner strip over every frame)
+# =====================================================
+if image_source == "Video Stream":
+    video = st.file_uploader("Upload conveyor video", type=["mp4", "avi", "mov", "mkv"])
+    frame_step = st.slider("Process every n-th frame", 1, 10, 1)
+
+    if video is None:
+        st.info("Upload a video to start")
+        st.stop()
+
+    if st.button("Run stream OCR on scanner strip"):
+        ws = workspace.JobWorkspace()
+        video_path = os.path.join(ws.path, video.name)
+        with open(video_path, "wb") as f:
+            f.write(video.getbuffer())
+
+        net, ocr = load_models()
+        stream = video_stream.FrameStreamOCR(
+            pipeline=OCRPipeline(net=net, ocr=ocr, use_cache=False),
+            strip=(strip_orientation, strip_thickness_pct, strip_pos_pct)
+        )
+
+        live = st.empty()
+        try:
+            with workspace.job_slot(timeout=JOB_SLOT_TIMEOUT):
+                for frame in video_stream.read_frames(video_path, frame_step):
+                    strip, _ = stream.process(frame)
+                    if stream.frame_idx % 5 == 0:
+                        live.image(stream.draw(strip), caption=f"Frame {stream.frame_idx}", width="stretch")
+        except workspace.JobBusyError:
+            st.error("The server is busy with other scans, please retry in a moment")
+            st.stop()
+        finally:
+            ws.cleanup()
+
+        st.caption(
+            f"{stream.stats['frames']} frame(s), {stream.stats['keyframes']} CRAFT keyframe(s), "
+            f"{stream.stats['recognized']} crop(s) recognized, {stream.stats['skipped']} unchanged crop(s) skipped"
+        )
+        rows = stream.rows()
+        if rows:
+            st.dataframe(pd.DataFrame(rows), width="stretch")
+        else:
+            st.warning("No text found")
+    st.stop()
+
 uploaded = None
 if image_source == "Upload Image":
     uploaded = st.file_uploader(
@@ -189,20 +303,24 @@ else:
 # LOAD IMAGE
 # =====================================================
 if uploaded is not None:
-    img = Image.open(uploaded)
+    # Streamlit decodes again on every rerun (each slider move), so this is
+    # kept apart from the per-job "decode" stage
+    with metrics.timed("rerun_decode"):
+        img = Image.open(uploaded)
 
-    if keep_exif:
-        img = ImageOps.exif_transpose(img)
+        if keep_exif:
+            img = ImageOps.exif_transpose(img)
 
-    img = img.convert("RGB")
+        img = img.convert("RGB")
 
-    buf = BytesIO()
-    img.save(buf, format="PNG")
-    buf.seek(0)
-    img = Image.open(buf).convert("RGB")
+        buf = BytesIO()
+        img.save(buf, format="PNG")
+        buf.seek(0)
+        img = Image.open(buf).convert("RGB")
+
+        img_np = np.array(img)
 
     orig_w, orig_h = img.size
-    img_np = np.array(img)
 
     st.caption(f"Original image size: {orig_w} × {orig_h}px")
 
@@ -211,6 +329,7 @@ if uploaded is not None:
     canvas_h = int(orig_h * scale)
 
     img_display = img.resize((canvas_w, canvas_h), Image.BILINEAR)
+    source_id = getattr(uploaded, "file_id", uploaded.name)
 
 else:
     st.info("Upload or capture an image to start")
@@ -296,16 +415,12 @@ if MOBILE_STRIP_MODE:
     prev_h = int(orig_h * prev_scale)
     preview = img.resize((prev_w, prev_h), Image.BILINEAR)
 
+    x1, y1, x2, y2 = video_stream.strip_rect(orig_w, orig_h, strip_orientation, strip_thickness_pct, strip_pos_pct)
     thickness = int((strip_thickness_pct / 100.0) * (orig_h if strip_orientation == "Horizontal" else orig_w))
     thickness = max(12, thickness)
     pos = strip_pos_pct / 100.0
 
     if strip_orientation == "Horizontal":
-        cy = int(pos * orig_h)
-        y1 = max(0, cy - thickness // 2)
-        y2 = min(orig_h, cy + thickness // 2)
-        x1, x2 = 0, orig_w
-
         # overlay style in preview space
         cy_p = int(pos * prev_h)
         t_p = max(10, int(thickness * prev_scale))
@@ -313,11 +428,6 @@ if MOBILE_STRIP_MODE:
         height_p = min(prev_h - top_p, t_p)
         strip_style = f"top:{top_p}px; height:{height_p}px;"
     else:
-        cx = int(pos * orig_w)
-        x1 = max(0, cx - thickness // 2)
-        x2 = min(orig_w, cx + thickness // 2)
-        y1, y2 = 0, orig_h
-
         cx_p = int(pos * prev_w)
         t_p = max(10, int(thickness * prev_scale))
         left_p = max(0, cx_p - t_p // 2)
@@ -368,7 +478,7 @@ else:
     st.write(f"{len(objects)} ROI(s) drawn")
 
 # =====================================================
-# RUN PIPELINE (UNCHANGED)
+# RUN PIPELINE (IN-PROCESS)
 # =====================================================
 btn_label = "Run CRAFT + OCR + Restitch"
 if MOBILE_STRIP_MODE:
@@ -380,11 +490,7 @@ if st.button(btn_label):
         st.warning("Select at least one ROI / strip")
         st.stop()
 
-    if os.path.exists(ROI_DIR):
-        shutil.rmtree(ROI_DIR)
-    os.makedirs(ROI_DIR, exist_ok=True)
-    st.info("Old ROI data cleared")
-
+    rois = []
     for roi_id, obj in enumerate(objects, start=1):
         left_d, top_d, width_d, height_d = obj_to_bbox_pixels(obj)
 
@@ -399,21 +505,120 @@ if st.button(btn_label):
         if x2 <= x1 or y2 <= y1:
             continue
 
-        roi = img_np[y1:y2, x1:x2]
-        Image.fromarray(roi).save(os.path.join(ROI_DIR, f"roi_{roi_id:02}.jpg"))
+        # view into the uploaded image, no re-encode
+        rois.append((f"roi_{roi_id:02}", img_np[y1:y2, x1:x2]))
 
-    st.success("ROI images saved")
+    workspace.cleanup_expired()
 
-    subprocess.run(
-        [sys.executable, os.path.join(BASE_DIR, "st_sample.py"), ROI_DIR],
-        check=True
-    )
+    sink = None
+    if save_artifacts:
+        ws = workspace.JobWorkspace()
+        sink = ArtifactSink(ws.path, result_dir=ws.result_dir, save_inputs=True)
+        st.caption(f"Job {ws.job_id}: artifacts in {ws.path}")
+
+    try:
+        try:
+            with st.spinner("Running CRAFT + OCR..."):
+                with workspace.job_slot(timeout=JOB_SLOT_TIMEOUT):
+                    results = get_pipeline().run_job(rois, sink=sink)
+        except workspace.JobBusyError:
+            st.error("The server is busy with other scans, please retry in a moment")
+            st.stop()
+
+        rows = table_rows(results)
+        if sink is not None:
+            sink.write_table(rows)
+
+        st.session_state["last_source"] = source_id
+        st.session_state["preview_rois"] = rois
+        st.session_state["results_rows"] = [result["rows"] for result in results]
+        st.session_state["results_df"] = pd.DataFrame(rows, columns=table_sinks.TABLE_COLUMNS)
+        st.session_state.pop("results_xlsx", None)
+        st.session_state.pop("preview_boxes", None)
+
+        st.success("Pipeline completed successfully")
+    finally:
+        # artifacts finish writing in the background while the results render
+        if sink is not None:
+            threading.Thread(target=close_sink, args=(sink,), name="artifacts-close").start()
 
-    st.success("Pipeline completed successfully")
+# =====================================================
+# RESULTS (in-memory frame; Excel built only on request)
+# =====================================================
+results_df = st.session_state.get("results_df")
+if st.session_state.get("last_source") == source_id and results_df is not None:
+    if results_df.empty:
+        st.warning("No text found")
+    else:
+        st.dataframe(results_df, width="stretch")
+
+        col_csv, col_xlsx = st.columns(2)
+        col_csv.download_button(
+            "Download CSV",
+            results_df.to_csv(index=False).encode("utf-8"),
+            "stitched_output.csv",
+            "text/csv"
+        )
+        if "results_xlsx" in st.session_state:
+            col_xlsx.download_button("Download Excel", st.session_state["results_xlsx"], "stitched_output.xlsx")
+        elif col_xlsx.button("Prepare Excel download"):
+            st.session_state["results_xlsx"] = table_sinks.excel_bytes(results_df)
+            st.rerun()
+
+        # overlays are drawn only on request, at preview size
+        if st.checkbox("Show stitched overlays", False):
+            for (name, roi), rows in zip(st.session_state["preview_rois"], st.session_state["results_rows"]):
+                overlay = render.render_stitched(cv2.cvtColor(roi, cv2.COLOR_RGB2BGR), rows, max_canvas_width)
+                st.image(overlay, channels="BGR", caption=name, width="stretch")
 
-    stitched_excel_path = os.path.join(ROI_DIR, "stitched", "stitched_output.xlsx")
-    if os.path.exists(stitched_excel_path):
-        df = pd.read_excel(stitched_excel_path)
-        st.dataframe(df, width="stretch")
-        with open(stitched_excel_path, "rb") as f:
-            st.download_button("Download Excel", f, "stitched_output.xlsx")
+# =====================================================
+# THRESHOLD PREVIEW (score maps of the last run)
+# =====================================================
+def preview_boxes(rois, thresholds):
+    """
+    Boxes of every ROI re-thresholded from its CRAFT score maps (None for
+    tiled ROIs). ROIs served from the detection cache have no stored maps
+    and need a forward pass, so this holds a job slot like a run does.
+    """
+    text_threshold, link_threshold, low_text = thresholds
+    pipeline = get_pipeline()
+    out = []
+    with workspace.job_slot(timeout=JOB_SLOT_TIMEOUT):
+        for _, roi in rois:
+            maps = pipeline.score_maps(roi)
+            out.append(None if maps is None else score_cache.rethreshold(
+                maps,
+                text_threshold=text_threshold,
+                link_threshold=link_threshold,
+                low_text=low_text
+            ))
+    return out
+
+
+if st.session_state.get("last_source") == source_id and st.session_state.get("preview_rois"):
+    if st.checkbox("Detection threshold preview", False):
+        st.caption(
+            "Boxes re-computed from the cached CRAFT score maps. Preview only: "
+            "copy tuned values into TEXT_THRESHOLD / LINK_THRESHOLD / LOW_TEXT in st_sample.py."
+        )
+        rois = st.session_state["preview_rois"]
+        thresholds = (preview_text, preview_link, preview_low)
+
+        # recomputed only when the sliders (or the run) change
+        cached = st.session_state.get("preview_boxes")
+        if cached is None or cached[0] != thresholds:
+            try:
+                cached = (thresholds, preview_boxes(rois, thresholds))
+            except workspace.JobBusyError:
+                st.error("The server is busy with other scans, please retry in a moment")
+                st.stop()
+            st.session_state["preview_boxes"] = cached
+
+        for (name, roi), boxes in zip(rois, cached[1]):
+            if boxes is None:
+                st.caption(f"{name}: detected tile by tile, no threshold preview")
+                continue
+            viz = roi.copy()
+            for box in boxes:
+                cv2.polylines(viz, [np.asarray(box, dtype=np.int32)], True, (255, 0, 0), 2)
+            st.image(viz, caption=f"{name}: {len(boxes)} box(es)", width="stretch")
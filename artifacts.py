@@ -0,0 +1,135 @@
+import os
+import threading
+import cv2
+from concurrent.futures import ThreadPoolExecutor
+
+from job_store import JOB_STORE_NAME, JobRecorder
+import metrics
+import render
+import table_sinks
+
+
+# =========================
+# ASYNC ARTIFACT SINK
+# =========================
+ARTIFACT_QUEUE_SIZE = int(os.environ.get("OCR_ARTIFACT_QUEUE", 32))    # pending writes before submit blocks
+
+
+class ArtifactSink:
+    """
+    Persists pipeline results on a background thread:
+
+        <base>/<roi>.jpg                              (save_inputs only)
+        <base>/cropped_boxes/<roi>_boxNNN.jpg         (save_crops only)
+        <base>/job_results.npz                        boxes, OCR, rows (job_store)
+        <base>/sample_result/<roi>_result.jpg         (render_viz only, or <result_dir>)
+        <base>/stitched/<roi>_stitched.jpg            (render_viz only)
+        <base>/stitched/stitched_output.<csv|jsonl|parquet|xlsx>
+
+    Boxes, OCR text/confidences and stitched rows of the whole job go to
+    one columnar store written on `close`, instead of per-crop JSON files.
+    Overlays are not drawn unless `render_viz` is set (then at
+    `viz_max_side` preview size); `render.py` can produce them later from
+    the job store. The pipeline never reads these files back.
+    At most `max_pending` writes are queued; `submit` blocks beyond that,
+    so a slow disk cannot pile every ROI and crop up in memory.
+    """
+
+    def __init__(self, base_dir, result_dir=None, save_inputs=False, save_crops=True,
+                 table_format=table_sinks.TABLE_FORMAT, render_viz=render.RENDER_VIZ,
+                 viz_max_side=render.PREVIEW_SIDE, workers=1, max_pending=ARTIFACT_QUEUE_SIZE):
+        self.base_dir = base_dir
+        self.result_dir = result_dir or os.path.join(base_dir, "sample_result")
+        self.save_inputs = save_inputs
+        self.save_crops = save_crops
+        self.crop_dir = os.path.join(base_dir, "cropped_boxes")
+        self.stitched_dir = os.path.join(base_dir, "stitched")
+        self.store_path = os.path.join(base_dir, JOB_STORE_NAME)
+        self.table_format = table_format
+        self.render_viz = render_viz
+        self.viz_max_side = viz_max_side
+        self._table = None
+
+        for d in (self.base_dir, self.crop_dir, self.stitched_dir):
+            os.makedirs(d, exist_ok=True)
+        if render_viz:
+            os.makedirs(self.result_dir, exist_ok=True)
+
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="artifacts")
+        self._futures = []
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._recorder = JobRecorder()
+
+    # -------------------------
+    # Public API
+    # -------------------------
+    def submit(self, name, image_bgr, crops, rows):
+        """ Queues every artifact of one ROI. Arrays must not be mutated afterwards. """
+        self._recorder.add(name, crops, rows)
+        self._submit(self._write_roi, name, image_bgr, crops, rows)
+
+    def write_table(self, table_rows):
+        """ Appends output table rows; may be called once per image or once per job. """
+        self._submit(self._write_table, table_rows)
+
+    def close(self):
+        """ Waits for all queued writes, writes the job store, re-raises the first failure. """
+        try:
+            for f in self._futures:
+                f.result()
+        finally:
+            self._futures = []
+            self._pool.shutdown(wait=True)
+            if self._table is not None:
+                with metrics.timed("output"):
+                    self._table.close()
+                self._table = None
+
+        if len(self._recorder):
+            with metrics.timed("output"):
+                self._recorder.save(self.store_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _submit(self, fn, *args):
+        self._slots.acquire()
+        future = self._pool.submit(fn, *args)
+        future.add_done_callback(lambda _: self._slots.release())
+        self._futures.append(future)
+
+    # -------------------------
+    # Writers (worker thread)
+    # -------------------------
+    @metrics.timed("output")
+    def _write_roi(self, name, image_bgr, crops, rows):
+        if self.save_inputs:
+            cv2.imwrite(os.path.join(self.base_dir, f"{name}.jpg"), image_bgr)
+
+        if self.save_crops:
+            for crop in crops:
+                cv2.imwrite(os.path.join(self.crop_dir, f"{name}_box{crop['index']:03}.jpg"), crop["image"])
+
+        if not self.render_viz:
+            return
+
+        cv2.imwrite(
+            os.path.join(self.result_dir, f"{name}_result.jpg"),
+            render.render_detections(
+                image_bgr, [c["box"] for c in crops], [c["index"] for c in crops], self.viz_max_side
+            )
+        )
+
+        if rows:
+            out_img = os.path.join(self.stitched_dir, name + "_stitched.jpg")
+            cv2.imwrite(out_img, render.render_stitched(image_bgr, rows, self.viz_max_side))
+            print(f"✅ Saved stitched image: {out_img}")
+
+    @metrics.timed("output")
+    def _write_table(self, table_rows):
+        if self._table is None:
+            self._table = table_sinks.open_table_sink(self.stitched_dir, fmt=self.table_format)
+        self._table.write(table_rows)
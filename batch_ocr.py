@@ -0,0 +1,195 @@
+"""
+Offline batch OCR over large image archives.
+
+    python batch_ocr.py <input_dir> --out <out_dir> --workers 8 --threads 2
+
+The image list is sharded across worker processes, each with its own
+CRAFT + PaddleOCR and pinned thread counts. Every worker appends one JSON
+line per finished image to <out_dir>/shards/worker_XX.jsonl, so an
+interrupted run resumes where it stopped. Images that fail are recorded
+as {"image", "error"} lines and skipped on resume (--restart retries
+them). The shards are merged into <out_dir>/results.<csv|jsonl|parquet|xlsx>
+at the end (--format).
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import multiprocessing as mp
+import pandas as pd
+
+import file_utils
+import table_sinks
+
+DEFAULT_WORKERS = max(1, (os.cpu_count() or 1) // 2)
+DEFAULT_THREADS = 2
+
+
+# =========================
+# SHARDING / CHECKPOINTS
+# =========================
+def list_images(input_dir):
+    image_list, _, _ = file_utils.get_files(input_dir)
+    return sorted(image_list)
+
+
+def shard(items, n_shards):
+    return [items[i::n_shards] for i in range(n_shards)]
+
+
+def shard_path(out_dir, worker_id):
+    return os.path.join(out_dir, "shards", f"worker_{worker_id:02}.jsonl")
+
+
+def load_done(out_dir):
+    """ Images already recorded in any shard checkpoint. """
+    done = set()
+    shard_dir = os.path.join(out_dir, "shards")
+    if not os.path.isdir(shard_dir):
+        return done
+
+    for name in os.listdir(shard_dir):
+        if not name.endswith(".jsonl"):
+            continue
+        with open(os.path.join(shard_dir, name), "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    done.add(json.loads(line)["image"])
+                except (ValueError, KeyError):
+                    continue    # torn last line from an interrupted run
+    return done
+
+
+# =========================
+# WORKER
+# =========================
+def _pin_threads(threads):
+    """
+    Sets the BLAS/OpenMP pool sizes. Must run in the parent before the
+    workers start: spawned children import numpy, cv2 and pandas (this
+    module's imports) before `worker` runs, and those read the variables
+    once at load time.
+    """
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(threads)
+
+
+def worker(worker_id, input_dir, paths, out_dir, threads):
+    # heavy imports inside the child process
+    import cv2
+    import torch
+    import crop_cache
+    import st_Recognition
+    from pipeline import OCRPipeline
+
+    cv2.setNumThreads(threads)
+    torch.set_num_threads(threads)
+
+    ocr = st_Recognition.load_ocr(cpu_threads=threads)
+    # no shared on-disk result cache: N workers would only churn it with
+    # one-off archive images; the in-process crop cache still applies.
+    # CRAFT (the QUANTIZED / DETECT_BACKEND selection) loads on first use.
+    pipeline = OCRPipeline(ocr=ocr, use_cuda=False, use_cache=False,
+                           crop_ocr_cache=crop_cache.default_crop_cache())
+
+    sources = [(os.path.relpath(p, input_dir), p) for p in paths]
+    t0 = time.time()
+
+    with open(shard_path(out_dir, worker_id), "a", encoding="utf-8") as f:
+        for n, result in enumerate(pipeline.run_stream(sources), start=1):
+            if "error" in result:
+                record = {"image": result["name"], "error": result["error"]}
+            else:
+                record = {
+                    "image": result["name"],
+                    "boxes": len(result["boxes"]),
+                    "rows": [row["text"] for row in result["rows"]]
+                }
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+
+            if n % 50 == 0 or n == len(sources):
+                rate = n / max(time.time() - t0, 1e-6)
+                print(f"[worker {worker_id:02}] {n}/{len(sources)} ({rate:.1f} img/s)", flush=True)
+
+
+# =========================
+# MERGE
+# =========================
+def merge(out_dir, fmt="csv"):
+    rows, failed = [], []
+    shard_dir = os.path.join(out_dir, "shards")
+
+    for name in sorted(os.listdir(shard_dir)):
+        if not name.endswith(".jsonl"):
+            continue
+        with open(os.path.join(shard_dir, name), "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if "error" in record:
+                    failed.append(record["image"])
+                    continue
+                for text in record["rows"]:
+                    rows.append({"image": record["image"], "text": text})
+
+    if failed:
+        print(f"⚠️ {len(failed)} image(s) failed and are not in the table, e.g. {failed[0]}")
+
+    df = pd.DataFrame(rows, columns=["image", "text"]).sort_values("image", kind="stable")
+    with table_sinks.open_table_sink(out_dir, name="results", fmt=fmt) as table:
+        table.write(df.to_dict("records"))
+    return table.path
+
+
+# =========================
+# MAIN
+# =========================
+def main():
+    parser = argparse.ArgumentParser(description="Multi-process batch OCR over an image folder")
+    parser.add_argument("input_dir")
+    parser.add_argument("--out", required=True, help="output dir (checkpoints + merged results table)")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--threads", type=int, default=DEFAULT_THREADS, help="torch/paddle threads per worker")
+    parser.add_argument("--restart", action="store_true", help="ignore existing checkpoints")
+    parser.add_argument("--format", default="csv", choices=sorted(table_sinks.SINKS), help="merged table format")
+    args = parser.parse_args()
+
+    os.makedirs(os.path.join(args.out, "shards"), exist_ok=True)
+
+    if args.restart:
+        for name in os.listdir(os.path.join(args.out, "shards")):
+            os.remove(os.path.join(args.out, "shards", name))
+
+    image_list = list_images(args.input_dir)
+    done = load_done(args.out)
+    todo = [p for p in image_list if os.path.relpath(p, args.input_dir) not in done]
+    print(f"{len(image_list)} image(s), {len(done)} already done, {len(todo)} to process")
+
+    failed = []
+    if todo:
+        n_workers = min(args.workers, len(todo))
+        _pin_threads(args.threads)        # inherited by the spawned workers
+        ctx = mp.get_context("spawn")     # fresh interpreter per worker, no forked torch state
+        procs = [
+            ctx.Process(target=worker, args=(i, args.input_dir, paths, args.out, args.threads))
+            for i, paths in enumerate(shard(todo, n_workers))
+        ]
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join()
+
+        failed = [i for i, p in enumerate(procs) if p.exitcode != 0]
+        if failed:
+            print(f"⚠️ Worker(s) {failed} failed; rerun to resume the remaining images")
+
+    merge(args.out, args.format)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+import os
+import threading
+from contextlib import contextmanager
+import numpy as np
+
+# =========================
+# POOL SETTINGS
+# =========================
+POOL_MAX_BYTES = int(os.environ.get("OCR_POOL_MAX_MB", 128)) * 1024 * 1024
+POOL_MAX_PER_SHAPE = int(os.environ.get("OCR_POOL_MAX_PER_SHAPE", 4))   # per size class
+POOL_MIN_ITEMS = 1 << 16
+
+
+def size_class(n):
+    """ `n` rounded up to one of 8 steps per power of two (≤ 12.5% slack). """
+    n = max(int(n), POOL_MIN_ITEMS)
+    step = 1 << max(n.bit_length() - 4, 0)
+    return -(-n // step) * step
+
+
+class BufferPool:
+    """
+    Free lists of flat float32 buffers keyed by size class. `acquire`
+    hands out a contiguous view of the requested shape on a buffer of the
+    next class up, so user-drawn ROIs of similar (not identical) size
+    share buffers instead of each pinning its own exact shape.
+    Released buffers beyond `max_per_shape` per class or `max_bytes` in
+    total are dropped, evicting the least recently released class first.
+    """
+
+    def __init__(self, max_bytes=POOL_MAX_BYTES, max_per_shape=POOL_MAX_PER_SHAPE, dtype=np.float32):
+        self.max_bytes = max_bytes
+        self.max_per_shape = max_per_shape
+        self.dtype = np.dtype(dtype)
+        self.hits = 0
+        self.misses = 0
+        self._free = {}      # size class → [flat arrays], insertion order = release order
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, shape):
+        shape = tuple(int(s) for s in shape)
+        n = int(np.prod(shape))
+        cls = size_class(n)
+        with self._lock:
+            free = self._free.get(cls)
+            if free:
+                flat = free.pop()
+                self._bytes -= flat.nbytes
+                if not free:
+                    del self._free[cls]
+                self.hits += 1
+            else:
+                flat = None
+                self.misses += 1
+        if flat is None:
+            flat = np.empty(cls, dtype=self.dtype)
+        return flat[:n].reshape(shape)
+
+    def release(self, buf):
+        flat = buf if buf.base is None else buf.base
+        if flat.ndim != 1 or flat.size != size_class(flat.size) or flat.nbytes > self.max_bytes:
+            return
+        cls = flat.size
+        with self._lock:
+            free = self._free.pop(cls, [])
+            if len(free) >= self.max_per_shape:
+                self._free[cls] = free
+                return
+
+            free.append(flat)
+            self._free[cls] = free       # re-insert: most recently used class last
+            self._bytes += flat.nbytes
+
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._free))
+                dropped = self._free[oldest].pop(0)
+                self._bytes -= dropped.nbytes
+                if not self._free[oldest]:
+                    del self._free[oldest]
+
+    @contextmanager
+    def borrow(self, shape):
+        buf = self.acquire(shape)
+        try:
+            yield buf
+        finally:
+            self.release(buf)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "bytes": self._bytes,
+                "classes": len(self._free)
+            }
+
+
+detect_pool = BufferPool()
@@ -0,0 +1,164 @@
+import os
+import argparse
+import numpy as np
+import torch
+import torch.nn as nn
+from torch.fx.experimental.optimization import fuse
+
+import st_sample
+from refinenet import RefineNet
+
+# =========================
+# BACKEND SETTINGS
+# =========================
+ONNX_OPSET = 17
+EXPORT_SIZE = 640           # dummy input side used for export/tracing
+ORT_THREADS = int(os.environ.get("ORT_THREADS", 0))   # 0 = onnxruntime default
+
+BACKENDS = ("torch", "torchscript", "onnx")
+
+
+class CraftWithRefiner(nn.Module):
+    """
+    CRAFT followed by the LinkRefiner. The refined link map replaces
+    channel 1 so the output layout matches plain CRAFT.
+    """
+
+    def __init__(self, net, refine_net):
+        super(CraftWithRefiner, self).__init__()
+        self.net = net
+        self.refine_net = refine_net
+
+    def forward(self, x):
+        y, feature = self.net(x)
+        y_refiner = self.refine_net(y, feature)
+        return torch.cat([y[:, :, :, 0:1], y_refiner], dim=3), feature
+
+
+# =========================
+# BACKENDS
+# =========================
+# Every backend exposes `infer(x)`: NCHW float32 batch (tensor or array)
+# → (N, H/2, W/2, 2) numpy score maps. `st_sample.forward_net` dispatches
+# to it, so backends can be passed anywhere a CRAFT net is accepted.
+class TorchScriptBackend:
+    name = "torchscript"
+
+    def __init__(self, path, use_cuda=False):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"TorchScript CRAFT not found at {path}")
+
+        self.device = torch.device("cuda" if use_cuda and torch.cuda.is_available() else "cpu")
+        module = torch.jit.load(path, map_location=self.device).eval()
+        self.module = torch.jit.optimize_for_inference(module)
+        print("CRAFT (TorchScript) loaded")
+
+    def infer(self, x):
+        x = torch.as_tensor(x).to(self.device)
+        with torch.no_grad():
+            y, _ = self.module(x)
+        return y.cpu().numpy()
+
+
+class OnnxBackend:
+    name = "onnx"
+
+    def __init__(self, path, use_cuda=False, threads=ORT_THREADS):
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise ImportError("The onnx backend needs onnxruntime: pip install onnxruntime")
+
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"ONNX CRAFT not found at {path}")
+
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            opts.intra_op_num_threads = threads
+
+        providers = ["CPUExecutionProvider"]
+        if use_cuda and "CUDAExecutionProvider" in ort.get_available_providers():
+            providers.insert(0, "CUDAExecutionProvider")
+
+        self.session = ort.InferenceSession(path, sess_options=opts, providers=providers)
+        self.input_name = self.session.get_inputs()[0].name
+        self.output_name = self.session.get_outputs()[0].name
+        print("CRAFT (ONNX Runtime) loaded")
+
+    def infer(self, x):
+        x = np.ascontiguousarray(np.asarray(x), dtype=np.float32)
+        return self.session.run([self.output_name], {self.input_name: x})[0]
+
+
+def load_backend(backend, path, use_cuda=False):
+    if backend == "torchscript":
+        return TorchScriptBackend(path, use_cuda)
+    if backend == "onnx":
+        return OnnxBackend(path, use_cuda)
+    raise ValueError(f"Unknown detection backend: {backend} (expected one of {BACKENDS})")
+
+
+# =========================
+# EXPORT
+# =========================
+def load_eager(refiner_path=None):
+    net = st_sample.load_craft(use_cuda=False)
+    if refiner_path is None:
+        return net
+
+    refine_net = RefineNet()
+    refine_net.load_state_dict(
+        st_sample.copyStateDict(torch.load(refiner_path, map_location="cpu"))
+    )
+    refine_net.eval()
+    return CraftWithRefiner(net, refine_net).eval()
+
+
+def export_onnx(net, path=st_sample.ONNX_MODEL_PATH, size=EXPORT_SIZE, opset=ONNX_OPSET):
+    """ Exports CRAFT with dynamic batch/height/width axes. """
+    dummy = torch.zeros((1, 3, size, size), dtype=torch.float32)
+
+    with torch.no_grad():
+        torch.onnx.export(
+            net, dummy, path,
+            input_names=["image"],
+            output_names=["score", "feature"],
+            dynamic_axes={
+                "image": {0: "batch", 2: "height", 3: "width"},
+                "score": {0: "batch", 1: "score_h", 2: "score_w"},
+                "feature": {0: "batch", 2: "score_h", 3: "score_w"}
+            },
+            opset_version=opset
+        )
+
+    print(f"ONNX CRAFT saved: {path}")
+
+
+def export_torchscript(net, path=st_sample.TS_MODEL_PATH):
+    """
+    BN-folds CRAFT through torch.fx and scripts the resulting graph
+    (the eager forward builds a namedtuple, which TorchScript can't script).
+    """
+    module = torch.jit.script(fuse(net.cpu().eval()))
+    torch.jit.save(module, path)
+    print(f"TorchScript CRAFT saved: {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export CRAFT for the torchscript / onnx backends")
+    parser.add_argument("format", choices=["onnx", "torchscript"])
+    parser.add_argument("--out", default=None)
+    parser.add_argument("--refiner_model", default=None, help="also bake in the LinkRefiner")
+    args = parser.parse_args()
+
+    net = load_eager(args.refiner_model)
+
+    if args.format == "onnx":
+        export_onnx(net, args.out or st_sample.ONNX_MODEL_PATH)
+    else:
+        export_torchscript(net, args.out or st_sample.TS_MODEL_PATH)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+import os
+import json
+import time
+import argparse
+import numpy as np
+import cv2
+import torch
+import torch.nn as nn
+from torch.fx.experimental.optimization import fuse
+from torch.ao.quantization import get_default_qconfig_mapping
+from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+
+import imgproc
+import file_utils
+import st_sample
+
+# =========================
+# QUANTIZATION SETTINGS
+# =========================
+QUANT_BACKEND = "x86"       # "x86" (fbgemm + onednn) or "qnnpack" for ARM
+CALIB_MAX_IMAGES = 64
+MATCH_IOU = 0.5             # box match threshold for the accuracy report
+
+
+class QuantizedCRAFT(nn.Module):
+    """ Thin wrapper so callers can tell the INT8 model apart (always CPU). """
+    quantized = True
+
+    def __init__(self, module):
+        super(QuantizedCRAFT, self).__init__()
+        self.module = module
+
+    def forward(self, x):
+        return self.module(x)
+
+
+# =========================
+# BUILD
+# =========================
+def fold_bn(net):
+    """ Folds every BatchNorm2d into its preceding Conv2d (eval mode, FP32). """
+    net = net.cpu().eval()
+    return fuse(net)
+
+
+def calibration_images(calib_dir, max_images=CALIB_MAX_IMAGES):
+    image_list, _, _ = file_utils.get_files(calib_dir)
+    image_list = sorted(image_list)[:max_images]
+    if not image_list:
+        raise RuntimeError(f"No calibration images found in {calib_dir}")
+    return image_list
+
+
+def quantize_craft(net, calib_dir, backend=QUANT_BACKEND, max_images=CALIB_MAX_IMAGES):
+    """
+    BN folding + static INT8 post-training quantization of CRAFT.
+    Activation ranges are calibrated on the ROI images in `calib_dir`,
+    preprocessed exactly as `st_sample.test_net` does.
+    """
+    torch.backends.quantized.engine = backend
+
+    folded = fold_bn(net)
+    example = torch.zeros((1, 3, 320, 320), dtype=torch.float32)
+    prepared = prepare_fx(folded, get_default_qconfig_mapping(backend), example_inputs=(example,))
+
+    image_list = calibration_images(calib_dir, max_images)
+    with torch.no_grad():
+        for idx, image_path in enumerate(image_list, start=1):
+            print(f"[{idx}/{len(image_list)}] Calibrating on {image_path}")
+            x, _ = st_sample.prepare_input(imgproc.loadImage(image_path))
+            prepared(x)
+
+    return convert_fx(prepared)
+
+
+def save_quantized_craft(qnet, path=st_sample.QUANT_MODEL_PATH):
+    torch.jit.save(torch.jit.script(qnet), path)
+    print(f"INT8 CRAFT saved: {path}")
+
+
+def load_quantized_craft(path=st_sample.QUANT_MODEL_PATH, backend=QUANT_BACKEND):
+    if not os.path.exists(path):
+        raise FileNotFoundError(
+            f"INT8 CRAFT model not found at {path} (build it with craft_quant.py build)"
+        )
+
+    torch.backends.quantized.engine = backend
+    net = QuantizedCRAFT(torch.jit.load(path, map_location="cpu"))
+    net.eval()
+
+    print("CRAFT (INT8) loaded")
+    return net
+
+
+# =========================
+# ACCURACY CHECK
+# =========================
+def _rect_iou(a, b):
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    iw = min(ax + aw, bx + bw) - max(ax, bx)
+    ih = min(ay + ah, by + bh) - max(ay, by)
+    if iw <= 0 or ih <= 0:
+        return 0.0
+    inter = iw * ih
+    return inter / float(aw * ah + bw * bh - inter)
+
+
+def match_boxes(ref_boxes, boxes, iou_thresh=MATCH_IOU):
+    """ Greedy one-to-one matching on bounding-rect IoU. Returns the matched IoUs. """
+    ref = [cv2.boundingRect(np.asarray(b, dtype=np.float32)) for b in ref_boxes]
+    cand = [cv2.boundingRect(np.asarray(b, dtype=np.float32)) for b in boxes]
+
+    pairs = sorted(
+        ((_rect_iou(r, c), i, j) for i, r in enumerate(ref) for j, c in enumerate(cand)),
+        reverse=True
+    )
+
+    used_ref, used_cand, ious = set(), set(), []
+    for iou, i, j in pairs:
+        if iou < iou_thresh:
+            break
+        if i in used_ref or j in used_cand:
+            continue
+        used_ref.add(i)
+        used_cand.add(j)
+        ious.append(iou)
+
+    return ious
+
+
+def accuracy_report(fp32_net, int8_net, image_dir, iou_thresh=MATCH_IOU):
+    """
+    Runs both models over `image_dir` and compares their boxes.
+    Recall/precision treat the FP32 boxes as ground truth.
+    """
+    image_list, _, _ = file_utils.get_files(image_dir)
+    image_list = sorted(image_list)
+
+    rows = []
+    for image_path in image_list:
+        image = imgproc.loadImage(image_path)
+
+        t0 = time.time()
+        ref_boxes = st_sample.test_net(fp32_net, image)
+        t1 = time.time()
+        boxes = st_sample.test_net(int8_net, image)
+        t2 = time.time()
+
+        ious = match_boxes(ref_boxes, boxes, iou_thresh)
+        rows.append({
+            "image": os.path.basename(image_path),
+            "fp32_boxes": len(ref_boxes),
+            "int8_boxes": len(boxes),
+            "matched": len(ious),
+            "mean_iou": float(np.mean(ious)) if ious else 0.0,
+            "fp32_ms": (t1 - t0) * 1000.0,
+            "int8_ms": (t2 - t1) * 1000.0
+        })
+
+    n_ref = sum(r["fp32_boxes"] for r in rows)
+    n_int8 = sum(r["int8_boxes"] for r in rows)
+    n_match = sum(r["matched"] for r in rows)
+    fp32_ms = sum(r["fp32_ms"] for r in rows)
+    int8_ms = sum(r["int8_ms"] for r in rows)
+
+    summary = {
+        "images": len(rows),
+        "iou_threshold": iou_thresh,
+        "recall": n_match / n_ref if n_ref else 1.0,
+        "precision": n_match / n_int8 if n_int8 else 1.0,
+        "mean_iou": float(np.mean([r["mean_iou"] for r in rows if r["matched"]])) if n_match else 0.0,
+        "speedup": fp32_ms / int8_ms if int8_ms else 0.0
+    }
+
+    return {"summary": summary, "images": rows}
+
+
+# =========================
+# CLI
+# =========================
+def main():
+    parser = argparse.ArgumentParser(description="INT8 CRAFT build + accuracy check")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_build = sub.add_parser("build", help="fold BN, calibrate and save the INT8 model")
+    p_build.add_argument("calib_dir", help="folder of ROI images for calibration")
+    p_build.add_argument("--out", default=st_sample.QUANT_MODEL_PATH)
+    p_build.add_argument("--max_images", type=int, default=CALIB_MAX_IMAGES)
+
+    p_check = sub.add_parser("check", help="compare INT8 boxes against FP32")
+    p_check.add_argument("image_dir", help="folder of ROI images to compare on")
+    p_check.add_argument("--model", default=st_sample.QUANT_MODEL_PATH)
+    p_check.add_argument("--report", default=None, help="write the full report as JSON")
+
+    args = parser.parse_args()
+
+    fp32_net = st_sample.load_craft(use_cuda=False)
+    if isinstance(fp32_net, nn.DataParallel):
+        fp32_net = fp32_net.module
+
+    if args.cmd == "build":
+        qnet = quantize_craft(fp32_net, args.calib_dir, max_images=args.max_images)
+        save_quantized_craft(qnet, args.out)
+        return
+
+    report = accuracy_report(fp32_net, load_quantized_craft(args.model), args.image_dir)
+    for row in report["images"]:
+        print(
+            f"{row['image']}: fp32={row['fp32_boxes']} int8={row['int8_boxes']} "
+            f"matched={row['matched']} iou={row['mean_iou']:.3f} "
+            f"({row['fp32_ms']:.0f} ms → {row['int8_ms']:.0f} ms)"
+        )
+
+    s = report["summary"]
+    print(
+        f"📊 recall={s['recall']:.3f} precision={s['precision']:.3f} "
+        f"mean_iou={s['mean_iou']:.3f} speedup={s['speedup']:.2f}x"
+    )
+
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report saved: {args.report}")
+
+
+if __name__ == "__main__":
+    main()
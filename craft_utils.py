@@ -13,13 +13,27 @@ import math
 def warpCoord(Minv, pt):
     out = np.matmul(Minv, (pt[0], pt[1], 1))
     return np.array([out[0]/out[2], out[1]/out[2]])
+
+# does a 1-px line touch the mask? draws only into the line's bounding box
+def lineHitsMask(mask, pt1, pt2):
+    img_h, img_w = mask.shape
+    # clip first, as cv2.line does on a mask-sized image
+    inside, (x0, y0), (x1, y1) = cv2.clipLine((0, 0, img_w, img_h), pt1, pt2)
+    if not inside: return False
+
+    lx, ty = min(x0, x1), min(y0, y1)
+    rx, by = max(x0, x1), max(y0, y1)
+
+    line_img = np.zeros((by - ty + 1, rx - lx + 1), dtype=np.uint8)
+    cv2.line(line_img, (x0 - lx, y0 - ty), (x1 - lx, y1 - ty), 1, thickness=1)
+    return bool(np.any(line_img & mask[ty:by+1, lx:rx+1]))
 """ end of auxilary functions """
 
 
 def getDetBoxes_core(textmap, linkmap, text_threshold, link_threshold, low_text):
     # prepare data
-    linkmap = linkmap.copy()
-    textmap = textmap.copy()
+    linkmap = np.ascontiguousarray(linkmap)
+    textmap = np.ascontiguousarray(textmap)
     img_h, img_w = textmap.shape
 
     """ labeling method """
@@ -29,6 +43,11 @@ def getDetBoxes_core(textmap, linkmap, text_threshold, link_threshold, low_text)
     text_score_comb = np.clip(text_score + link_score, 0, 1)
     nLabels, labels, stats, centroids = cv2.connectedComponentsWithStats(text_score_comb.astype(np.uint8), connectivity=4)
 
+    # per-label max score in a single pass, link area mask computed once
+    label_max = np.zeros(nLabels, dtype=textmap.dtype)
+    np.maximum.at(label_max, labels.ravel(), textmap.ravel())
+    link_area = np.logical_and(link_score==1, text_score==0)
+
     det = []
     mapper = []
     for k in range(1,nLabels):
@@ -37,12 +56,8 @@ def getDetBoxes_core(textmap, linkmap, text_threshold, link_threshold, low_text)
         if size < 10: continue
 
         # thresholding
-        if np.max(textmap[labels==k]) < text_threshold: continue
+        if label_max[k] < text_threshold: continue
 
-        # make segmentation map
-        segmap = np.zeros(textmap.shape, dtype=np.uint8)
-        segmap[labels==k] = 255
-        segmap[np.logical_and(link_score==1, text_score==0)] = 0   # remove link area
         x, y = stats[k, cv2.CC_STAT_LEFT], stats[k, cv2.CC_STAT_TOP]
         w, h = stats[k, cv2.CC_STAT_WIDTH], stats[k, cv2.CC_STAT_HEIGHT]
         niter = int(math.sqrt(size * min(w, h) / (w * h)) * 2)
@@ -52,11 +67,17 @@ def getDetBoxes_core(textmap, linkmap, text_threshold, link_threshold, low_text)
         if sy < 0 : sy = 0
         if ex >= img_w: ex = img_w
         if ey >= img_h: ey = img_h
+
+        # make segmentation map inside the dilation window only
+        segmap = np.zeros((ey - sy, ex - sx), dtype=np.uint8)
+        segmap[labels[sy:ey, sx:ex]==k] = 255
+        segmap[link_area[sy:ey, sx:ex]] = 0   # remove link area
         kernel = cv2.getStructuringElement(cv2.MORPH_RECT,(1 + niter, 1 + niter))
-        segmap[sy:ey, sx:ex] = cv2.dilate(segmap[sy:ey, sx:ex], kernel)
+        segmap = cv2.dilate(segmap, kernel)
 
         # make box
-        np_contours = np.roll(np.array(np.where(segmap!=0)),1,axis=0).transpose().reshape(-1,2)
+        ys, xs = np.where(segmap!=0)
+        np_contours = np.stack((xs + sx, ys + sy), axis=1)
         rectangle = cv2.minAreaRect(np_contours)
         box = cv2.boxPoints(rectangle)
 
@@ -64,8 +85,8 @@ def getDetBoxes_core(textmap, linkmap, text_threshold, link_threshold, low_text)
         w, h = np.linalg.norm(box[0] - box[1]), np.linalg.norm(box[1] - box[2])
         box_ratio = max(w, h) / (min(w, h) + 1e-5)
         if abs(1 - box_ratio) <= 0.1:
-            l, r = min(np_contours[:,0]), max(np_contours[:,0])
-            t, b = min(np_contours[:,1]), max(np_contours[:,1])
+            l, r = np_contours[:,0].min(), np_contours[:,0].max()
+            t, b = np_contours[:,1].min(), np_contours[:,1].max()
             box = np.array([[l, t], [r, t], [r, b], [l, b]], dtype=np.float32)
 
         # make clock-wise order
@@ -78,6 +99,28 @@ def getDetBoxes_core(textmap, linkmap, text_threshold, link_threshold, low_text)
 
     return det, labels, mapper
 
+def warpLabel(labels, label, M, Minv, w, h, scratch):
+    """
+    Same as warpPerspective((labels == label).astype(np.uint8), M, (w, h),
+    flags=INTER_NEAREST), but only binarizes the label region the warp
+    samples from. `scratch` is an all-zero uint8 array of labels.shape and
+    is all-zero again on return; the warp runs on it with the unchanged M,
+    so the sampling is bit-identical. None if that region is off the map.
+    """
+    src = cv2.perspectiveTransform(np.float32([[[-1,-1],[w+1,-1],[w+1,h+1],[-1,h+1]]]), Minv)[0]
+    x0, y0 = np.floor(src.min(axis=0)).astype(int) - 2
+    x1, y1 = np.ceil(src.max(axis=0)).astype(int) + 2
+    x0, y0 = max(x0, 0), max(y0, 0)
+    x1, y1 = min(x1, labels.shape[1]), min(y1, labels.shape[0])
+    if x1 <= x0 or y1 <= y0:
+        return None
+
+    region = scratch[y0:y1, x0:x1]
+    np.equal(labels[y0:y1, x0:x1], label, out=region, casting="unsafe")
+    word_label = cv2.warpPerspective(scratch, M, (w, h), flags=cv2.INTER_NEAREST)
+    region[...] = 0
+    return word_label
+
 def getPoly_core(boxes, labels, mapper, linkmap):
     # configs
     num_cp = 5
@@ -87,6 +130,7 @@ def getPoly_core(boxes, labels, mapper, linkmap):
     step_r = 0.2
 
     polys = []  
+    scratch = np.zeros(labels.shape, np.uint8)
     for k, box in enumerate(boxes):
         # size filter for small instance
         w, h = int(np.linalg.norm(box[0] - box[1]) + 1), int(np.linalg.norm(box[1] - box[2]) + 1)
@@ -96,27 +140,23 @@ def getPoly_core(boxes, labels, mapper, linkmap):
         # warp image
         tar = np.float32([[0,0],[w,0],[w,h],[0,h]])
         M = cv2.getPerspectiveTransform(box, tar)
-        word_label = cv2.warpPerspective(labels, M, (w, h), flags=cv2.INTER_NEAREST)
         try:
             Minv = np.linalg.inv(M)
         except:
             polys.append(None); continue
 
-        # binarization for selected label
-        cur_label = mapper[k]
-        word_label[word_label != cur_label] = 0
-        word_label[word_label > 0] = 1
+        word_label = warpLabel(labels, mapper[k], M, Minv, w, h, scratch)
+        if word_label is None:
+            polys.append(None); continue
 
         """ Polygon generation """
-        # find top/bottom contours
-        cp = []
-        max_len = -1
-        for i in range(w):
-            region = np.where(word_label[:,i] != 0)[0]
-            if len(region) < 2 : continue
-            cp.append((i, region[0], region[-1]))
-            length = region[-1] - region[0] + 1
-            if length > max_len: max_len = length
+        # find top/bottom contours: first/last set row of every column
+        nz = word_label != 0
+        top = nz.argmax(axis=0)
+        bottom = h - 1 - nz[::-1].argmax(axis=0)
+        cols = np.nonzero(nz.sum(axis=0) >= 2)[0]
+        cp = list(zip(cols.tolist(), top[cols].tolist(), bottom[cols].tolist()))
+        max_len = int((bottom[cols] - top[cols]).max()) + 1 if len(cols) else -1
 
         # pass if max_len is similar to h
         if h * max_len_ratio < max_len:
@@ -186,19 +226,15 @@ def getPoly_core(boxes, labels, mapper, linkmap):
         for r in np.arange(0.5, max_r, step_r):
             dx = 2 * half_char_h * r
             if not isSppFound:
-                line_img = np.zeros(word_label.shape, dtype=np.uint8)
                 dy = grad_s * dx
                 p = np.array(new_pp[0]) - np.array([dx, dy, dx, dy])
-                cv2.line(line_img, (int(p[0]), int(p[1])), (int(p[2]), int(p[3])), 1, thickness=1)
-                if np.sum(np.logical_and(word_label, line_img)) == 0 or r + 2 * step_r >= max_r:
+                if not lineHitsMask(word_label, (int(p[0]), int(p[1])), (int(p[2]), int(p[3]))) or r + 2 * step_r >= max_r:
                     spp = p
                     isSppFound = True
             if not isEppFound:
-                line_img = np.zeros(word_label.shape, dtype=np.uint8)
                 dy = grad_e * dx
                 p = np.array(new_pp[-1]) + np.array([dx, dy, dx, dy])
-                cv2.line(line_img, (int(p[0]), int(p[1])), (int(p[2]), int(p[3])), 1, thickness=1)
-                if np.sum(np.logical_and(word_label, line_img)) == 0 or r + 2 * step_r >= max_r:
+                if not lineHitsMask(word_label, (int(p[0]), int(p[1])), (int(p[2]), int(p[3]))) or r + 2 * step_r >= max_r:
                     epp = p
                     isEppFound = True
             if isSppFound and isEppFound:
@@ -0,0 +1,247 @@
+import os
+import threading
+from collections import OrderedDict
+import cv2
+import numpy as np
+
+# =========================
+# CROP CACHE SETTINGS
+# =========================
+CROP_CACHE_ENABLED = os.environ.get("OCR_CROP_CACHE", "1") != "0"
+CROP_CACHE_SIZE = int(os.environ.get("OCR_CROP_CACHE_SIZE", 20000))      # entries
+PHASH_THRESHOLD = int(os.environ.get("OCR_PHASH_THRESHOLD", 6))          # max differing bits of 256
+PHASH_SHAPE = (32, 128)      # normalized crop (h, w) before the DCT
+PHASH_LOW = (8, 32)          # low-frequency DCT block kept → 256-bit hash
+ASPECT_BUCKETS = (2, 4, 8, 16)   # upper bounds of w / h per hash group
+
+
+# =========================
+# PERCEPTUAL HASH
+# =========================
+def crop_hash(img):
+    """
+    256-bit DCT perceptual hash of a BGR/RGB/gray crop as a uint8[32].
+    The crop is grayscaled and resized to PHASH_SHAPE first, so size,
+    brightness and contrast changes between repeats of the same marking
+    do not change the hash.
+    """
+    gray = img if img.ndim == 2 else cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    gray = cv2.resize(gray, PHASH_SHAPE[::-1], interpolation=cv2.INTER_AREA)
+
+    dct = cv2.dct(np.float32(gray))
+    low = dct[:PHASH_LOW[0], :PHASH_LOW[1]].ravel()
+    bits = low > np.median(low[1:])     # DC term only carries brightness
+    return np.packbits(bits)
+
+
+def aspect_bucket(img):
+    h, w = img.shape[:2]
+    ratio = w / max(h, 1)
+    for i, bound in enumerate(ASPECT_BUCKETS):
+        if ratio <= bound:
+            return i
+    return len(ASPECT_BUCKETS)
+
+
+def _scale_boxes(ocr_json, sx, sy):
+    return [
+        dict(item, box=[[x * sx, y * sy] for x, y in item["box"]])
+        for item in ocr_json
+    ]
+
+
+def rescale(ocr_json, src_shape, dst_shape):
+    """ Maps an OCR result of a crop of `src_shape` onto a crop of `dst_shape`. """
+    if ocr_json is None:
+        return None
+    return _scale_boxes(ocr_json, dst_shape[1] / max(src_shape[1], 1), dst_shape[0] / max(src_shape[0], 1))
+
+
+# =========================
+# NEAR-DUPLICATE INDEX
+# =========================
+_POPCOUNT8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+_POPCOUNT16 = _POPCOUNT8[np.arange(1 << 16) & 0xFF] + _POPCOUNT8[np.arange(1 << 16) >> 8]
+
+
+def hamming(hashes, h):
+    """ Bit distance between every row of `hashes` (N, 32) uint8 and `h`. """
+    diff = np.bitwise_xor(hashes, h)
+    if hasattr(np, "bitwise_count"):     # numpy >= 2
+        return np.bitwise_count(diff).sum(axis=1, dtype=np.int32)
+    return _POPCOUNT16[diff.view(np.uint16)].sum(axis=1, dtype=np.int32)
+
+
+class _HashGroup:
+    """
+    Preallocated hash rows of one group. Removed rows go on a free list and
+    are reused, and the arrays only grow (by doubling), so adds and
+    removals never copy the group.
+    """
+
+    def __init__(self, n_bytes, capacity=64):
+        self.hashes = np.zeros((capacity, n_bytes), np.uint8)
+        self.ids = np.full(capacity, -1, np.int64)
+        self.used = np.zeros(capacity, bool)
+        self.free = []
+        self.top = 0        # rows handed out so far (high-water mark)
+
+    def __len__(self):
+        return self.top - len(self.free)
+
+    def add(self, h, entry_id):
+        if self.free:
+            row = self.free.pop()
+        else:
+            if self.top == len(self.ids):
+                self._grow()
+            row = self.top
+            self.top += 1
+        self.hashes[row] = h
+        self.ids[row] = entry_id
+        self.used[row] = True
+        return row
+
+    def remove(self, row):
+        self.used[row] = False
+        self.ids[row] = -1
+        self.free.append(row)
+
+    def nearest(self, h):
+        """ (entry id, distance) of the closest used row. """
+        dist = hamming(self.hashes[:self.top], h)
+        dist[~self.used[:self.top]] = self.hashes.shape[1] * 8 + 1
+        best = int(np.argmin(dist))
+        return int(self.ids[best]), int(dist[best])
+
+    def _grow(self):
+        capacity = 2 * len(self.ids)
+        hashes = np.zeros((capacity, self.hashes.shape[1]), np.uint8)
+        ids = np.full(capacity, -1, np.int64)
+        used = np.zeros(capacity, bool)
+        hashes[:self.top], ids[:self.top], used[:self.top] = self.hashes, self.ids, self.used
+        self.hashes, self.ids, self.used = hashes, ids, used
+
+
+class HashIndex:
+    """
+    Hash → value store with nearest-neighbour lookup by Hamming distance,
+    partitioned by an exact group key (crops of different aspect buckets
+    never match). Least recently used entries drop out past `max_entries`.
+    """
+
+    def __init__(self, threshold=PHASH_THRESHOLD, max_entries=None):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._groups = {}        # group → _HashGroup
+        self._entries = OrderedDict()   # entry id → (group, row, value)
+        self._next_id = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def find(self, group, h):
+        """ Entry id of the nearest hash within `threshold`, or None. """
+        rows = self._groups.get(group)
+        if not rows:
+            return None
+
+        entry_id, dist = rows.nearest(h)
+        if dist > self.threshold:
+            return None
+
+        self._entries.move_to_end(entry_id)
+        return entry_id
+
+    def value(self, entry_id):
+        return self._entries[entry_id][2]
+
+    def add(self, group, h, value):
+        entry_id = self._next_id
+        self._next_id += 1
+
+        rows = self._groups.get(group)
+        if rows is None:
+            rows = self._groups[group] = _HashGroup(h.size)
+        self._entries[entry_id] = (group, rows.add(h, entry_id), value)
+
+        if self.max_entries is not None:
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+        return entry_id
+
+    def _remove(self, entry_id):
+        group, row, _ = self._entries.pop(entry_id)
+        self._groups[group].remove(row)
+
+
+# =========================
+# CROP OCR CACHE
+# =========================
+class CropOCRCache:
+    """
+    Process-wide recognition cache keyed on the perceptual hash of each
+    crop, so repeated sidewall markings (brand, size code, TUBELESS...)
+    are recognized once. Boxes are stored relative to the crop size and
+    scaled back to the size of the crop being served.
+    """
+
+    def __init__(self, threshold=PHASH_THRESHOLD, max_entries=CROP_CACHE_SIZE):
+        self.index = HashIndex(threshold, max_entries)
+        self.hits = 0
+        self.misses = 0
+        self.repeats = 0     # hits served by an identical crop of the same job (part of `hits`)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def group(img, mode=None):
+        return (mode, aspect_bucket(img))
+
+    def get(self, img, h, mode=None):
+        """ (True, ocr_json) on a hit, (False, None) on a miss. ocr_json may itself be None. """
+        with self._lock:
+            entry_id = self.index.find(self.group(img, mode), h)
+            if entry_id is None:
+                self.misses += 1
+                return False, None
+            self.hits += 1
+            ocr_json = self.index.value(entry_id)
+
+        if ocr_json is None:
+            return True, None
+        h_img, w_img = img.shape[:2]
+        return True, _scale_boxes(ocr_json, w_img, h_img)
+
+    def put(self, img, h, ocr_json, mode=None):
+        if ocr_json is not None:
+            h_img, w_img = img.shape[:2]
+            ocr_json = _scale_boxes(ocr_json, 1.0 / max(w_img, 1), 1.0 / max(h_img, 1))
+        with self._lock:
+            self.index.add(self.group(img, mode), h, ocr_json)
+
+    def count_repeats(self, n):
+        """ `n` crops that missed in `get` were served by a same-job repeat: count them as hits. """
+        with self._lock:
+            self.misses -= n
+            self.hits += n
+            self.repeats += n
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "repeats": self.repeats,
+                    "entries": len(self.index)}
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def default_crop_cache():
+    """ Process-wide crop cache, or None when OCR_CROP_CACHE=0. """
+    global _default
+    if not CROP_CACHE_ENABLED:
+        return None
+    with _default_lock:
+        if _default is None:
+            _default = CropOCRCache()
+    return _default
@@ -64,6 +64,45 @@ def resize_aspect_ratio(img, square_size, interpolation, mag_ratio=1):
 
     return resized, ratio, size_heatmap
 
+def target_geometry(height, width, square_size, mag_ratio=1):
+    # same sizing as resize_aspect_ratio, without touching any pixels
+    target_size = min(mag_ratio * max(height, width), square_size)
+    ratio = target_size / max(height, width)
+
+    target_h, target_w = int(height * ratio), int(width * ratio)
+    target_h32 = target_h + (-target_h % 32)
+    target_w32 = target_w + (-target_w % 32)
+
+    return target_h, target_w, target_h32, target_w32, ratio
+
+def resize_normalize_into(img, out, square_size, interpolation, mag_ratio=1,
+                          mean=(0.485, 0.456, 0.406), variance=(0.229, 0.224, 0.225)):
+    """
+    Fused resize_aspect_ratio + normalizeMeanVariance. Writes the result
+    straight into `out`, a float32 (3, H, W) CHW view at least as large
+    as the 32-aligned canvas. The padding gets the normalized value of a
+    zero pixel, so the output equals normalizing the zero-padded canvas.
+    Returns (ratio, size_heatmap) like resize_aspect_ratio.
+    """
+    height, width = img.shape[:2]
+    target_h, target_w, target_h32, target_w32, ratio = target_geometry(height, width, square_size, mag_ratio)
+    proc = cv2.resize(img, (target_w, target_h), interpolation = interpolation)
+
+    for c in range(3):
+        m = np.float32(mean[c] * 255.0)
+        v = np.float32(variance[c] * 255.0)
+        plane = out[c]
+        roi = plane[:target_h, :target_w]
+
+        np.subtract(proc[:, :, c], m, out=roi, dtype=np.float32)
+        roi /= v
+        plane[target_h:, :] = -m / v
+        plane[:target_h, target_w:] = -m / v
+
+    size_heatmap = (int(target_w32/2), int(target_h32/2))
+
+    return ratio, size_heatmap
+
 def cvt2HeatmapImg(img):
     img = (np.clip(img, 0, 1) * 255).astype(np.uint8)
     img = cv2.applyColorMap(img, cv2.COLORMAP_JET)
@@ -0,0 +1,145 @@
+import os
+import threading
+import numpy as np
+
+# =========================
+# JOB RESULT STORE
+# =========================
+# One columnar NPZ per job replaces the per-crop <crop>_ocr.json sidecars
+# and per-ROI <roi>_mapping.json files. Columns (B boxes, T OCR texts,
+# R stitched rows), all loadable with allow_pickle=False:
+#
+#   roi_name    (N,) str
+#   box_roi     (B,) int32    row into roi_name
+#   box_index   (B,) int32    1-based reading-order index within the ROI
+#   box_pts     (P, 2) int32  box outlines, concatenated (quads, or polygons with st_sample.POLY)
+#   box_npts    (B,) int32    point count per box
+#   box_rect    (B, 4) int32  clipped crop rect (x1, y1, x2, y2)
+#   box_has_ocr (B,) bool     False when PaddleOCR returned nothing
+#   ocr_box     (T,) int32    row into box
+#   ocr_text    (T,) str
+#   ocr_conf    (T,) float32
+#   ocr_quad    (T, 4, 2) float32  text box inside the crop
+#   row_roi     (R,) int32
+#   row_text    (R,) str
+#   row_rect    (R, 4) int32  (x, y, w, h)
+JOB_STORE_NAME = "job_results.npz"
+
+
+def _quad(points):
+    quad = np.asarray(points, dtype=np.float32).reshape(-1, 2)
+    if len(quad) != 4:      # polygons → their bounding quad
+        (x1, y1), (x2, y2) = quad.min(axis=0), quad.max(axis=0)
+        quad = np.float32([[x1, y1], [x2, y1], [x2, y2], [x1, y2]])
+    return quad
+
+
+class JobRecorder:
+    """ Accumulates `run_job`-style ROI results in memory, then writes one NPZ. """
+
+    def __init__(self):
+        self._rois = []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._rois)
+
+    def add(self, name, crops, rows):
+        record = (
+            name,
+            [(c["index"], np.asarray(c["box"], dtype=np.int32), c["rect"], c.get("ocr")) for c in crops],
+            [(row["text"], row["rect"]) for row in rows]
+        )
+        with self._lock:
+            self._rois.append(record)
+
+    def columns(self):
+        with self._lock:
+            rois = list(self._rois)
+
+        cols = {k: [] for k in ("box_roi", "box_index", "box_pts", "box_rect", "box_has_ocr",
+                                "ocr_box", "ocr_text", "ocr_conf", "ocr_quad",
+                                "row_roi", "row_text", "row_rect")}
+        for roi_id, (_, crops, rows) in enumerate(rois):
+            for index, box, rect, ocr_json in crops:
+                box_id = len(cols["box_pts"])
+                cols["box_roi"].append(roi_id)
+                cols["box_index"].append(index)
+                cols["box_pts"].append(box.reshape(-1, 2))
+                cols["box_rect"].append(rect)
+                cols["box_has_ocr"].append(ocr_json is not None)
+
+                for item in ocr_json or []:
+                    cols["ocr_box"].append(box_id)
+                    cols["ocr_text"].append(item["text"])
+                    cols["ocr_conf"].append(item["confidence"])
+                    cols["ocr_quad"].append(_quad(item["box"]))
+
+            for text, rect in rows:
+                cols["row_roi"].append(roi_id)
+                cols["row_text"].append(text)
+                cols["row_rect"].append(rect)
+
+        return {
+            "roi_name": np.array([name for name, _, _ in rois], dtype=str),
+            "box_roi": np.array(cols["box_roi"], dtype=np.int32),
+            "box_index": np.array(cols["box_index"], dtype=np.int32),
+            "box_pts": np.concatenate(cols["box_pts"]) if cols["box_pts"] else np.zeros((0, 2), np.int32),
+            "box_npts": np.array([len(box) for box in cols["box_pts"]], dtype=np.int32),
+            "box_rect": np.array(cols["box_rect"], dtype=np.int32).reshape(-1, 4),
+            "box_has_ocr": np.array(cols["box_has_ocr"], dtype=bool),
+            "ocr_box": np.array(cols["ocr_box"], dtype=np.int32),
+            "ocr_text": np.array(cols["ocr_text"], dtype=str),
+            "ocr_conf": np.array(cols["ocr_conf"], dtype=np.float32),
+            "ocr_quad": np.array(cols["ocr_quad"], dtype=np.float32).reshape(-1, 4, 2),
+            "row_roi": np.array(cols["row_roi"], dtype=np.int32),
+            "row_text": np.array(cols["row_text"], dtype=str),
+            "row_rect": np.array(cols["row_rect"], dtype=np.int32).reshape(-1, 4),
+        }
+
+    def save(self, path):
+        """ Writes the whole job in one file (atomically). Returns `path`. """
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez_compressed(f, **self.columns())
+        os.replace(tmp, path)
+        return path
+
+
+def load_job(path):
+    """ Bulk-loads a job store into a dict of column arrays. """
+    with np.load(path, allow_pickle=False) as npz:
+        return {k: npz[k] for k in npz.files}
+
+
+def job_rois(store):
+    """
+    Rebuilds per-ROI results from the columns:
+    [{"name", "crops": [{"index", "box", "rect", "ocr"}], "rows": [{"text", "rect"}]}]
+    """
+    rois = [{"name": str(name), "crops": [], "rows": []} for name in store["roi_name"]]
+
+    ocr_by_box = {}
+    for box_id, text, conf, quad in zip(store["ocr_box"], store["ocr_text"], store["ocr_conf"], store["ocr_quad"]):
+        ocr_by_box.setdefault(int(box_id), []).append(
+            {"text": str(text), "confidence": float(conf), "box": quad.tolist()}
+        )
+
+    if "box" in store:      # stores written before polygon support
+        boxes = list(store["box"])
+    else:
+        boxes = np.split(store["box_pts"], np.cumsum(store["box_npts"])[:-1]) if len(store["box_npts"]) else []
+
+    for box_id, (roi_id, index, box, rect, has_ocr) in enumerate(zip(
+            store["box_roi"], store["box_index"], boxes, store["box_rect"], store["box_has_ocr"])):
+        rois[roi_id]["crops"].append({
+            "index": int(index),
+            "box": box,
+            "rect": tuple(rect.tolist()),
+            "ocr": ocr_by_box.get(box_id, []) if has_ocr else None
+        })
+
+    for roi_id, text, rect in zip(store["row_roi"], store["row_text"], store["row_rect"]):
+        rois[roi_id]["rows"].append({"text": str(text), "rect": tuple(rect.tolist())})
+
+    return rois
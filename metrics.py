@@ -0,0 +1,204 @@
+"""
+Per-stage latency / size instrumentation with Prometheus text export.
+
+    with metrics.timed("craft_forward"):
+        ...
+
+    @metrics.timed("grouping")      # or as a decorator
+    def restitch(...): ...
+
+Stages: decode, preprocess (fused resize + normalize), craft_forward,
+get_det_boxes, crop, ocr, grouping, output. Threshold previews report as
+preview_det_boxes, and the Streamlit upload decode (repeated on every
+rerun) as rerun_decode. `render_prometheus()` is
+served at /metrics by service.py; `summary()` feeds the Streamlit sidebar.
+"""
+import os
+import sys
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+
+METRICS_ENABLED = os.environ.get("OCR_METRICS", "1") != "0"
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+# =========================
+# PRIMITIVES
+# =========================
+class Histogram:
+    """ Cumulative-bucket histogram per label value, Prometheus style. """
+
+    def __init__(self, name, help_text, label, buckets):
+        self.name = name
+        self.help = help_text
+        self.label = label
+        self.buckets = tuple(buckets)
+        self._series = {}    # label value → [bucket counts, sum, count, max]
+        self._lock = threading.Lock()
+
+    def observe(self, label_value, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = [[0] * (len(self.buckets) + 1), 0.0, 0, 0.0]
+            series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+            series[3] = max(series[3], value)
+
+    def snapshot(self):
+        with self._lock:
+            return {k: ([*v[0]], v[1], v[2], v[3]) for k, v in self._series.items()}
+
+    def quantile(self, label_value, q):
+        """ Upper bucket bound holding the q-quantile (None without data). """
+        counts, _, total, max_value = self.snapshot().get(label_value, (None, 0, 0, 0))
+        if not total:
+            return None
+        seen = 0
+        for bound, n in zip(self.buckets + (max_value,), counts):
+            seen += n
+            if seen >= q * total:
+                return min(bound, max_value)
+        return max_value
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for value, (counts, total_sum, total, _) in sorted(self.snapshot().items()):
+            label = f'{self.label}="{value}"'
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {total}')
+            lines.append(f"{self.name}_sum{{{label}}} {total_sum:.6f}")
+            lines.append(f"{self.name}_count{{{label}}} {total}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text, label):
+        self.name = name
+        self.help = help_text
+        self.label = label
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, label_value, n=1):
+        with self._lock:
+            self._values[label_value] = self._values.get(label_value, 0) + n
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for value, n in sorted(self.snapshot().items()):
+            lines.append(f'{self.name}{{{self.label}="{value}"}} {n}')
+        return lines
+
+
+STAGE_SECONDS = Histogram("ocr_stage_seconds", "Wall time per pipeline stage call.", "stage", LATENCY_BUCKETS)
+ITEM_COUNT = Histogram("ocr_items_per_call", "Boxes per ROI / crops per OCR call.", "kind", COUNT_BUCKETS)
+ITEMS_TOTAL = Counter("ocr_items_total", "Detected boxes and recognized crops.", "kind")
+
+
+# =========================
+# RECORDING
+# =========================
+@contextmanager
+def timed(stage):
+    if not METRICS_ENABLED:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(stage, time.perf_counter() - t0)
+
+
+def count(kind, n):
+    """ One call handled `n` items of `kind` (e.g. boxes of one ROI). """
+    if METRICS_ENABLED:
+        ITEM_COUNT.observe(kind, n)
+        ITEMS_TOTAL.inc(kind, n)
+
+
+# =========================
+# SCRAPE-TIME GAUGES
+# =========================
+def peak_rss_bytes():
+    try:
+        import resource
+    except ImportError:      # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def cache_stats():
+    """
+    {cache name: {"hits", "misses", ...}} for every live cache / pool.
+    Only reads caches already created: a scrape never opens (and walks)
+    the disk cache itself.
+    """
+    stats = {}
+    # imported here: these modules import st_sample, which imports this one
+    import result_cache
+    import crop_cache
+    import buffer_pool
+
+    cache = result_cache._default
+    if cache is not None:
+        for name, s in cache.stats().items():
+            stats[f"result_{name}"] = s
+    ocr_cache = crop_cache._default
+    if ocr_cache is not None:
+        stats["crop_ocr"] = ocr_cache.stats()
+    stats["detect_pool"] = buffer_pool.detect_pool.stats()
+    return stats
+
+
+def hit_rate(s):
+    total = s["hits"] + s["misses"]
+    return s["hits"] / total if total else None
+
+
+def render_prometheus():
+    lines = STAGE_SECONDS.expose() + ITEM_COUNT.expose() + ITEMS_TOTAL.expose()
+
+    rss = peak_rss_bytes()
+    if rss is not None:
+        lines += ["# HELP process_peak_rss_bytes Peak resident set size.",
+                  "# TYPE process_peak_rss_bytes gauge",
+                  f"process_peak_rss_bytes {rss}"]
+
+    caches = cache_stats()
+    for kind in ("hits", "misses"):
+        lines += [f"# HELP ocr_cache_{kind}_total Cache {kind} per cache.",
+                  f"# TYPE ocr_cache_{kind}_total counter"]
+        lines += [f'ocr_cache_{kind}_total{{cache="{name}"}} {s[kind]}' for name, s in sorted(caches.items())]
+
+    return "\n".join(lines) + "\n"
+
+
+def summary():
+    """ Per-stage rows for display: calls, mean / p95 / max milliseconds. """
+    rows = []
+    for stage, (_, total_sum, total, max_value) in sorted(STAGE_SECONDS.snapshot().items()):
+        p95 = STAGE_SECONDS.quantile(stage, 0.95)
+        rows.append({
+            "stage": stage,
+            "calls": total,
+            "mean_ms": round(1000 * total_sum / total, 1),
+            "p95_ms": round(1000 * p95, 1),
+            "max_ms": round(1000 * max_value, 1)
+        })
+    return rows
@@ -0,0 +1,102 @@
+import os
+import threading
+import numpy as np
+import torch
+
+import st_sample
+import st_Recognition
+
+# =========================
+# WARM-UP SETTINGS
+# =========================
+# Number of dummy inferences run right after a model is loaded (0 disables)
+WARMUP_RUNS = int(os.environ.get("OCR_WARMUP_RUNS", 1))
+# Side of the square dummy CRAFT input (must be 32-aligned)
+WARMUP_SIZE = int(os.environ.get("OCR_WARMUP_SIZE", 320))
+
+_lock = threading.Lock()
+_models = {}
+_model_locks = {}
+
+
+# =========================
+# WARM-UP
+# =========================
+def warmup_craft(net, runs=WARMUP_RUNS, size=WARMUP_SIZE):
+    x = torch.zeros((1, 3, size, size), dtype=torch.float32)
+
+    for _ in range(runs):
+        st_sample.forward_net(net, x)
+
+
+def warmup_ocr(ocr, runs=WARMUP_RUNS):
+    # white strip with a dark bar so the detector, angle classifier
+    # and recognizer all get exercised
+    img = np.full((48, 192, 3), 255, dtype=np.uint8)
+    img[16:32, 16:176] = 0
+
+    for _ in range(runs):
+        ocr.ocr(img, cls=True)
+
+
+# =========================
+# REGISTRY
+# =========================
+def get_craft(model_path=st_sample.CRAFT_MODEL_PATH, use_cuda=st_sample.USE_CUDA, warmup=WARMUP_RUNS,
+              quantized=False, backend="torch"):
+    """ Returns the process-wide CRAFT net / backend for `model_path`, loading it once. """
+    use_cuda = use_cuda and not quantized     # INT8 CRAFT is CPU only
+    key = ("craft", os.path.abspath(model_path), bool(use_cuda), bool(quantized), backend)
+
+    with _lock:
+        net = _models.get(key)
+        if net is None:
+            net = st_sample.load_craft(model_path, use_cuda, quantized, backend)
+            if warmup:
+                warmup_craft(net, warmup)
+                print(f"CRAFT warmed up ({warmup} run(s))")
+            _models[key] = net
+
+    return net
+
+
+def get_default_craft(use_cuda=st_sample.USE_CUDA, warmup=WARMUP_RUNS):
+    """
+    The CRAFT selected by st_sample.QUANTIZED / DETECT_BACKEND, from the
+    same model path `OCRPipeline` keys its detection cache on by default.
+    """
+    quantized, backend = st_sample.QUANTIZED, st_sample.DETECT_BACKEND
+    return get_craft(st_sample.default_model_path(quantized, backend), use_cuda, warmup,
+                     quantized=quantized, backend=backend)
+
+
+def get_ocr(warmup=WARMUP_RUNS):
+    """ Returns the process-wide PaddleOCR instance, loading it once. """
+    key = ("paddleocr",)
+
+    with _lock:
+        ocr = _models.get(key)
+        if ocr is None:
+            ocr = st_Recognition.load_ocr()
+            if warmup:
+                warmup_ocr(ocr, warmup)
+                print(f"PaddleOCR warmed up ({warmup} run(s))")
+            _models[key] = ocr
+
+    return ocr
+
+
+def model_lock(model):
+    """
+    Per-model lock for models that must not run concurrently. Paddle
+    predictors are not thread-safe, so shared PaddleOCR calls go through it;
+    CRAFT in eval mode under no_grad is safe to share between threads.
+    """
+    with _lock:
+        return _model_locks.setdefault(id(model), threading.Lock())
+
+
+def clear():
+    with _lock:
+        _models.clear()
+        _model_locks.clear()
@@ -0,0 +1,581 @@
+import os
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+
+import imgproc
+from artifacts import ArtifactSink
+import crop_cache
+import metrics
+import models
+import render
+import result_cache
+import score_cache
+import st_sample
+import st_Recognition
+import st_apo_restich
+
+# =========================
+# STREAMING SETTINGS
+# =========================
+STREAM_QUEUE_SIZE = 4       # max items waiting between two stages
+STREAM_DETECT_BATCH = st_sample.MAX_BATCH    # queued ROIs detected per CRAFT call
+DECODE_WORKERS = 2
+
+
+# =========================
+# IN-PROCESS PIPELINE
+# =========================
+class OCRPipeline:
+    """
+    CRAFT detection → PaddleOCR recognition → restitch, run in-process
+    on in-memory arrays. Models come from the process-wide registry in
+    `models` on first use, so every instance shares one CRAFT and one
+    PaddleOCR.
+    """
+
+    def __init__(self, craft_model_path=None,
+                 use_cuda=st_sample.USE_CUDA, net=None, ocr=None,
+                 rec_only=st_Recognition.REC_ONLY, tiled=True,
+                 quantized=st_sample.QUANTIZED, backend=st_sample.DETECT_BACKEND,
+                 use_cache=True, score_store=None, crop_ocr_cache=None):
+        if craft_model_path is None:
+            craft_model_path = st_sample.default_model_path(quantized, backend)
+
+        self.craft_model_path = craft_model_path
+        self.use_cuda = use_cuda
+        self.quantized = quantized
+        self.backend = backend
+        self.rec_only = rec_only
+        self.tiled = tiled
+        self._net = net
+        self._ocr = ocr
+        self.cache = result_cache.default_cache() if use_cache else None
+        self.score_store = score_store
+        if crop_ocr_cache is None and use_cache:
+            crop_ocr_cache = crop_cache.default_crop_cache()
+        self.crop_cache = crop_ocr_cache
+
+    @property
+    def net(self):
+        if self._net is None:
+            self._net = models.get_craft(
+                self.craft_model_path, self.use_cuda,
+                quantized=self.quantized, backend=self.backend
+            )
+        return self._net
+
+    @property
+    def ocr(self):
+        if self._ocr is None:
+            self._ocr = models.get_ocr()
+        return self._ocr
+
+    # -------------------------
+    # Stages
+    # -------------------------
+    def _needs_tiling(self, image):
+        return self.tiled and max(image.shape[:2]) > st_sample.TILE_TRIGGER
+
+    def cache_key(self, image):
+        """ Detection cache key of an RGB ROI (None when caching is off). """
+        if self.cache is None:
+            return None
+        extra = {"backend": self.backend, "quantized": self.quantized, "tiled": self._needs_tiling(image)}
+        if extra["tiled"]:
+            extra["tiling"] = [st_sample.TILE_SIZE, st_sample.TILE_OVERLAP,
+                               st_sample.TILE_MAG_RATIO, st_sample.TILE_TRIGGER]
+        return result_cache.detection_key(result_cache.image_hash(image), self.craft_model_path, extra)
+
+    def score_key(self, image):
+        """ Score-map store key of an RGB ROI (None without a store). """
+        if self.score_store is None:
+            return None
+        extra = {"backend": self.backend, "quantized": self.quantized}
+        return score_cache.score_key(image, self.craft_model_path, extra)
+
+    def score_maps(self, image):
+        """
+        Raw CRAFT score maps of a non-tiled RGB ROI, from the score store
+        when present, otherwise from one forward pass (stored for next time).
+        Detection never writes the store, so runs don't pay for previews.
+        None for ROIs detected tile by tile: a single downsampled map would
+        not match the detection that actually ran.
+        """
+        if self._needs_tiling(image):
+            return None
+
+        key = self.score_key(image)
+        if key is not None:
+            maps = self.score_store.get(key)
+            if maps is not None:
+                return maps
+
+        x, target_ratio = st_sample.prepare_input(image, st_sample.CANVAS_SIZE, st_sample.MAG_RATIO)
+        y = st_sample.forward_net(self.net, x)
+        maps = {"score_text": y[0, :, :, 0], "score_link": y[0, :, :, 1], "target_ratio": target_ratio}
+
+        if key is not None:
+            self.score_store.put(key, maps["score_text"], maps["score_link"], target_ratio)
+        return maps
+
+    def detect(self, image, key=None):
+        """ image: RGB array. Returns CRAFT boxes in reading order. """
+        if key is not None:
+            boxes = self.cache.get_boxes(key)
+            if boxes is not None:
+                return boxes
+
+        if self._needs_tiling(image):
+            boxes = st_sample.test_net_tiled(self.net, image)
+        else:
+            boxes = st_sample.test_net(self.net, image)
+        boxes = st_sample.sort_boxes_reading_order(boxes)
+
+        if key is not None:
+            self.cache.put_boxes(key, boxes)
+        return boxes
+
+    def detect_batch(self, images, keys=None):
+        """
+        images: list of RGB arrays. One CRAFT forward pass per shape bucket;
+        images above TILE_TRIGGER go through tiled detection instead.
+        `keys` (from `cache_key`) enable the detection cache.
+        """
+        if keys is None:
+            keys = [None] * len(images)
+        results = [None] * len(images)
+
+        small = []
+        for i, (image, key) in enumerate(zip(images, keys)):
+            if self._needs_tiling(image):
+                results[i] = self.detect(image, key)
+                continue
+            if key is not None:
+                results[i] = self.cache.get_boxes(key)
+                if results[i] is not None:
+                    continue
+            small.append(i)
+
+        batched = st_sample.test_net_batch(self.net, [images[i] for i in small])
+        for i, boxes in zip(small, batched):
+            results[i] = st_sample.sort_boxes_reading_order(boxes)
+            if keys[i] is not None:
+                self.cache.put_boxes(keys[i], results[i])
+
+        return results
+
+    def crop(self, image_bgr, boxes):
+        return st_sample.extract_crops(image_bgr, boxes)
+
+    def recognize(self, crops):
+        """
+        Adds an "ocr" list to every crop (None if PaddleOCR returned nothing).
+        With a crop cache, near-duplicate crops (perceptual hash) reuse earlier
+        results, and repeats within `crops` are recognized only once.
+        """
+        cache = self.crop_cache
+        if cache is None:
+            return self._recognize(crops)
+
+        todo, repeats = [], []
+        local = crop_cache.HashIndex(cache.index.threshold)
+        for crop in crops:
+            h = crop_cache.crop_hash(crop["image"])
+            hit, ocr_json = cache.get(crop["image"], h, self.rec_only)
+            if hit:
+                crop["ocr"] = ocr_json
+                continue
+
+            group = cache.group(crop["image"], self.rec_only)
+            first = local.find(group, h)
+            if first is None:
+                local.add(group, h, len(todo))
+                todo.append((crop, h))
+            else:
+                repeats.append((crop, todo[local.value(first)][0]))
+
+        self._recognize([crop for crop, _ in todo])
+
+        for crop, h in todo:
+            cache.put(crop["image"], h, crop["ocr"], self.rec_only)
+        for crop, source in repeats:
+            crop["ocr"] = crop_cache.rescale(source["ocr"], source["image"].shape, crop["image"].shape)
+        cache.count_repeats(len(repeats))
+        return crops
+
+    def _recognize(self, crops):
+        if not crops:
+            return crops
+        ocr = self.ocr
+        metrics.count("crops", len(crops))
+
+        with models.model_lock(ocr), metrics.timed("ocr"):
+            if self.rec_only:
+                results = st_Recognition.recognize_batch(ocr, [c["image"] for c in crops])
+                for crop, ocr_json in zip(crops, results):
+                    crop["ocr"] = ocr_json
+                return crops
+
+            for crop in crops:
+                crop["ocr"] = st_Recognition.recognize_crop(ocr, crop["image"])
+        return crops
+
+    def recognize_rois(self, results):
+        """
+        OCR for whole ROIs (run_job results), reusing cached per-ROI OCR
+        results and sending only the misses through `recognize` together.
+        """
+        todo = []
+        for result in results:
+            key = result.get("key")
+            if key is not None:
+                cached = self.cache.get_ocr(result_cache.ocr_key(key, self.ocr, self.rec_only))
+                if cached is not None and len(cached) == len(result["crops"]):
+                    for crop, ocr_json in zip(result["crops"], cached):
+                        crop["ocr"] = ocr_json
+                    continue
+            todo.append(result)
+
+        self.recognize([crop for result in todo for crop in result["crops"]])
+
+        for result in todo:
+            if result.get("key") is not None:
+                self.cache.put_ocr(
+                    result_cache.ocr_key(result["key"], self.ocr, self.rec_only),
+                    [crop["ocr"] for crop in result["crops"]]
+                )
+
+        return results
+
+    @metrics.timed("grouping")
+    def restitch(self, crops):
+        valid_crops = []
+        for crop in crops:
+            if crop.get("ocr") is None:
+                continue
+            for text in st_apo_restich.ocr_texts(crop["ocr"]):
+                valid_crops.append({
+                    "box": crop["box"],
+                    "text": text
+                })
+
+        return st_apo_restich.restitch(valid_crops)
+
+    def run(self, image):
+        """
+        Full pipeline on one RGB image.
+        Returns {"boxes", "crops", "rows"} where rows are the stitched lines.
+        """
+        result = self.run_job([("image", image)])[0]
+        return {"boxes": result["boxes"], "crops": result["crops"], "rows": result["rows"]}
+
+    def run_job(self, rois, sink=None):
+        """
+        Full pipeline over a job of (name, RGB array) ROIs, fully in memory.
+        Each ROI is converted to BGR once; crops are views into it and all
+        crops of the job go through one batched OCR pass. If `sink` (an
+        `artifacts.ArtifactSink`) is given, results are persisted in the
+        background. Repeat ROIs are served from the result cache. Returns
+        one {"name", "image", "key", "boxes", "crops", "rows"} dict per ROI,
+        "image" being the BGR copy.
+        """
+        images = [image for _, image in rois]
+        keys = [self.cache_key(image) for image in images]
+        all_boxes = self.detect_batch(images, keys)
+
+        results = [
+            self._roi_result(name, image, key, boxes)
+            for (name, image), key, boxes in zip(rois, keys, all_boxes)
+        ]
+
+        self.recognize_rois(results)
+
+        for result in results:
+            result["rows"] = self.restitch(result["crops"])
+            if sink is not None:
+                sink.submit(result["name"], result["image"], result["crops"], result["rows"])
+
+        return results
+
+    def _roi_result(self, name, image, key, boxes):
+        image_bgr = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+        return {"name": name, "image": image_bgr, "key": key, "boxes": boxes, "crops": self.crop(image_bgr, boxes)}
+
+    # -------------------------
+    # Streaming mode
+    # -------------------------
+    def _detect_many(self, items):
+        """
+        Detection for the (name, RGB array) items queued together, one
+        `detect_batch` call. Items that failed to decode, or fail on their
+        own when a batch fails, become {"name", "error"} results.
+        """
+        results = [None] * len(items)
+        ok = []
+        for i, (name, image) in enumerate(items):
+            if isinstance(image, Exception):
+                results[i] = _failed(name, image)
+            else:
+                ok.append(i)
+        if not ok:
+            return results
+
+        try:
+            detected = self._detect_items([items[i] for i in ok])
+        except Exception as e:
+            if len(ok) == 1:
+                detected = [_failed(items[ok[0]][0], e)]
+            else:
+                detected = [self._detect_many([items[i]])[0] for i in ok]
+
+        for i, result in zip(ok, detected):
+            results[i] = result
+        return results
+
+    def _detect_items(self, items):
+        images = [image for _, image in items]
+        keys = [self.cache_key(image) for image in images]
+        all_boxes = self.detect_batch(images, keys)
+        return [
+            self._roi_result(name, image, key, boxes)
+            for (name, image), key, boxes in zip(items, keys, all_boxes)
+        ]
+
+    def _recognize_one(self, result):
+        if "error" in result:
+            return result
+        try:
+            self.recognize_rois([result])
+            result["rows"] = self.restitch(result["crops"])
+        except Exception as e:
+            return _failed(result["name"], e)
+        return result
+
+    def run_stream(self, sources, sink=None, queue_size=STREAM_QUEUE_SIZE, decode_workers=DECODE_WORKERS,
+                   detect_batch=STREAM_DETECT_BATCH):
+        """
+        Streaming variant of `run_job` for many-ROI jobs. `sources` yields
+        (name, path or RGB array); decode, CRAFT, OCR and artifact writing
+        run concurrently on their own threads, linked by bounded queues,
+        so OCR of one ROI overlaps detection of the next. The CRAFT stage
+        takes up to `detect_batch` already-decoded ROIs per call, so they
+        still share shape-bucketed forward passes. Yields run_job style
+        results in input order; an image that fails to decode, detect or
+        recognize yields {"name", "error"} instead of ending the stream.
+        """
+        stop = threading.Event()
+        errors = []
+        detect_q = queue.Queue(max(queue_size, detect_batch))
+        ocr_q = queue.Queue(queue_size)
+        out_q = queue.Queue(queue_size)
+
+        def decode_stage():
+            try:
+                with ThreadPoolExecutor(decode_workers, thread_name_prefix="decode") as pool:
+                    pending = deque()
+                    for name, src in sources:
+                        if stop.is_set():
+                            break
+                        pending.append((name, pool.submit(_load_source, src)))
+                        if len(pending) >= 2 * decode_workers:
+                            name, future = pending.popleft()
+                            _put(detect_q, (name, _decoded(future)), stop)
+                    while pending:
+                        name, future = pending.popleft()
+                        _put(detect_q, (name, _decoded(future)), stop)
+            except _Stopped:
+                pass
+            except Exception as e:
+                errors.append(e)
+                stop.set()
+            finally:
+                _put_done(detect_q, stop)
+
+        threads = [
+            threading.Thread(target=decode_stage, name="decode-stage", daemon=True),
+            threading.Thread(target=_run_batch_stage,
+                             args=(self._detect_many, detect_q, ocr_q, stop, errors, detect_batch),
+                             name="craft-stage", daemon=True),
+            threading.Thread(target=_run_stage, args=(self._recognize_one, ocr_q, out_q, stop, errors),
+                             name="ocr-stage", daemon=True),
+        ]
+        for t in threads:
+            t.start()
+
+        try:
+            while True:
+                try:
+                    result = out_q.get(timeout=0.1)
+                except queue.Empty:
+                    if not any(t.is_alive() for t in threads):
+                        break
+                    continue
+                if result is _DONE:
+                    break
+
+                if sink is not None and "error" not in result:
+                    sink.submit(result["name"], result["image"], result["crops"], result["rows"])
+                yield result
+        finally:
+            stop.set()
+            for t in threads:
+                t.join()
+
+        if errors:
+            raise errors[0]
+
+    # -------------------------
+    # Folder mode (CLI)
+    # -------------------------
+    def run_dir(self, input_dir, render_viz=None):
+        """
+        Runs the pipeline over every image in `input_dir` and writes the
+        artifacts (crops, job result store and the table). Overlays are only
+        drawn with `render_viz` (default: `render.RENDER_VIZ`). Returns the
+        table rows.
+        """
+        image_list = [
+            os.path.join(input_dir, f)
+            for f in os.listdir(input_dir)
+            if f.lower().endswith((".jpg", ".png", ".jpeg"))
+        ]
+        if not image_list:
+            raise RuntimeError(f"No images found in {input_dir}")
+
+        sources = [(os.path.splitext(os.path.basename(p))[0], p) for p in image_list]
+
+        rows = []
+        if render_viz is None:
+            render_viz = render.RENDER_VIZ
+
+        with ArtifactSink(input_dir, render_viz=render_viz) as sink:
+            for idx_img, result in enumerate(self.run_stream(sources, sink=sink), start=1):
+                if "error" in result:
+                    print(f"[{idx_img}/{len(sources)}] ⚠️ Skipped {result['name']}: {result['error']}")
+                    continue
+                print(f"[{idx_img}/{len(sources)}] Processed {result['name']}")
+
+                # stream the table as images finish; keep only the rows in memory
+                result_rows = table_rows([result])
+                sink.write_table(result_rows)
+                rows.extend(result_rows)
+
+        return rows
+
+
+# =========================
+# STREAMING HELPERS
+# =========================
+_DONE = object()
+
+
+class _Stopped(Exception):
+    pass
+
+
+def _load_source(src):
+    if not isinstance(src, str):
+        return src
+    with metrics.timed("decode"):
+        image = imgproc.loadImage(src)
+    if image is None or image.ndim != 3:
+        raise ValueError(f"Could not decode {src}")
+    return image
+
+
+def _decoded(future):
+    """ Decoded image, or the exception that decoding raised. """
+    try:
+        return future.result()
+    except Exception as e:
+        return e
+
+
+def _failed(name, error):
+    return {"name": name, "error": f"{type(error).__name__}: {error}"}
+
+
+def _put(q, item, stop):
+    """ Blocking put that gives up once the stream is stopped. """
+    while True:
+        try:
+            q.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            if stop.is_set():
+                raise _Stopped()
+
+
+def _get(q, stop):
+    while True:
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            if stop.is_set():
+                raise _Stopped()
+
+
+def _put_done(q, stop):
+    try:
+        _put(q, _DONE, stop)
+    except _Stopped:
+        pass
+
+
+def _run_stage(fn, in_q, out_q, stop, errors):
+    try:
+        while True:
+            item = _get(in_q, stop)
+            if item is _DONE:
+                break
+            _put(out_q, fn(item), stop)
+    except _Stopped:
+        pass
+    except Exception as e:
+        errors.append(e)
+        stop.set()
+    finally:
+        _put_done(out_q, stop)
+
+
+def _run_batch_stage(fn, in_q, out_q, stop, errors, max_batch):
+    """ Like `_run_stage`, but `fn` maps a list of up to `max_batch` queued items to their results. """
+    try:
+        done = False
+        while not done:
+            item = _get(in_q, stop)
+            if item is _DONE:
+                break
+
+            items = [item]
+            while len(items) < max_batch:
+                try:
+                    item = in_q.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _DONE:
+                    done = True
+                    break
+                items.append(item)
+
+            for result in fn(items):
+                _put(out_q, result, stop)
+    except _Stopped:
+        pass
+    except Exception as e:
+        errors.append(e)
+        stop.set()
+    finally:
+        _put_done(out_q, stop)
+
+
+def table_rows(results):
+    """ Flattens `run_job` results into the [{"image", "text"}] output table. """
+    return [
+        {"image": result["name"], "text": row["text"]}
+        for result in results
+        for row in result["rows"]
+    ]
@@ -0,0 +1,110 @@
+"""
+On-demand overlays from stored results.
+
+    python render.py <job_dir> [--kind detections stitched] [--max-side 1280]
+
+Runs never draw debug images by default. Overlays are rendered from the
+boxes / text in <job_dir>/job_results.npz (see job_store) and the ROI
+images next to it, only when asked for and optionally downscaled first,
+so the polylines and text are drawn at preview resolution.
+"""
+import os
+import argparse
+import cv2
+import numpy as np
+
+from job_store import JOB_STORE_NAME, load_job, job_rois
+import st_sample
+import st_apo_restich
+
+# =========================
+# RENDER SETTINGS
+# =========================
+RENDER_VIZ = os.environ.get("OCR_RENDER_VIZ", "0") != "0"    # draw overlays during runs
+PREVIEW_SIDE = int(os.environ.get("OCR_PREVIEW_SIDE", 1280))  # longest side of previews (0 = full)
+
+
+def _fit(image, max_side):
+    """ Downscaled copy of `image` and its scale factor (never upscales). """
+    h, w = image.shape[:2]
+    scale = 1.0 if not max_side else min(1.0, max_side / max(h, w))
+    if scale == 1.0:
+        return image.copy(), 1.0
+    return cv2.resize(image, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA), scale
+
+
+def render_detections(image, boxes, indices=None, max_side=PREVIEW_SIDE):
+    """ CRAFT boxes with their reading-order index, on a (preview) copy of `image`. """
+    viz, scale = _fit(image, max_side)
+    if indices is None:
+        indices = range(1, len(boxes) + 1)
+
+    crops = []
+    for idx, box in zip(indices, boxes):
+        box = (np.asarray(box, dtype=np.float32) * scale).astype(np.int32)
+        x, y, _, _ = cv2.boundingRect(box)
+        crops.append({"index": idx, "box": box, "rect": (x, y)})
+
+    return st_sample.draw_detections(viz, crops)
+
+
+def render_stitched(image, rows, max_side=PREVIEW_SIDE):
+    """ Stitched lines and their text, on a (preview) copy of `image`. """
+    viz, scale = _fit(image, max_side)
+
+    scaled = [
+        {"text": row["text"], "rect": tuple(int(round(v * scale)) for v in row["rect"])}
+        for row in rows
+    ]
+    return st_apo_restich.draw_stitched(viz, scaled)
+
+
+def _find_image(job_dir, name):
+    for ext in (".jpg", ".png", ".jpeg"):
+        path = os.path.join(job_dir, name + ext)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def render_job(job_dir, out_dir=None, kinds=("detections", "stitched"), max_side=PREVIEW_SIDE):
+    """ Writes the requested overlays of every ROI of a finished job. Returns the paths. """
+    out_dir = out_dir or os.path.join(job_dir, "viz")
+    os.makedirs(out_dir, exist_ok=True)
+
+    written = []
+    for roi in job_rois(load_job(os.path.join(job_dir, JOB_STORE_NAME))):
+        image_path = _find_image(job_dir, roi["name"])
+        if image_path is None:
+            print(f"⚠️ Missing image for {roi['name']}")
+            continue
+        image = cv2.imread(image_path)
+
+        if "detections" in kinds:
+            path = os.path.join(out_dir, f"{roi['name']}_result.jpg")
+            crops = roi["crops"]
+            cv2.imwrite(path, render_detections(image, [c["box"] for c in crops], [c["index"] for c in crops], max_side))
+            written.append(path)
+
+        if "stitched" in kinds and roi["rows"]:
+            path = os.path.join(out_dir, f"{roi['name']}_stitched.jpg")
+            cv2.imwrite(path, render_stitched(image, roi["rows"], max_side))
+            written.append(path)
+
+    print(f"🖼️ Rendered {len(written)} overlay(s) into {out_dir}")
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render overlays of a finished OCR job")
+    parser.add_argument("job_dir", help=f"folder with {JOB_STORE_NAME} and the ROI images")
+    parser.add_argument("--out", default=None, help="output folder (default <job_dir>/viz)")
+    parser.add_argument("--kind", nargs="+", choices=["detections", "stitched"], default=["detections", "stitched"])
+    parser.add_argument("--max-side", type=int, default=PREVIEW_SIDE, help="preview size, 0 = full resolution")
+    args = parser.parse_args()
+
+    render_job(args.job_dir, args.out, args.kind, args.max_side)
+
+
+if __name__ == "__main__":
+    main()
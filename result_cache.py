@@ -0,0 +1,243 @@
+import os
+import io
+import json
+import hashlib
+import threading
+import numpy as np
+
+import st_sample
+import st_Recognition
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# =========================
+# CACHE SETTINGS
+# =========================
+CACHE_ENABLED = os.environ.get("OCR_CACHE", "1") != "0"
+CACHE_DIR = os.environ.get("OCR_CACHE_DIR", os.path.join(BASE_DIR, ".cache", "results"))
+CACHE_MAX_BYTES = int(os.environ.get("OCR_CACHE_MAX_MB", 512)) * 1024 * 1024
+
+_weights_hashes = {}
+_recognizer_hashes = {}
+
+
+# =========================
+# KEYS
+# =========================
+def image_hash(image):
+    h = hashlib.blake2b(digest_size=16)
+    h.update(str((image.shape, image.dtype.str)).encode())
+    h.update(np.ascontiguousarray(image).data)
+    return h.hexdigest()
+
+
+def weights_hash(path):
+    """ Content hash of a model file, memoized on (path, size, mtime). """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return "missing"
+
+    key = (os.path.abspath(path), st.st_size, st.st_mtime)
+    if key not in _weights_hashes:
+        h = hashlib.blake2b(digest_size=16)
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        _weights_hashes[key] = h.hexdigest()
+    return _weights_hashes[key]
+
+
+def _params_hash(params):
+    return hashlib.blake2b(json.dumps(params, sort_keys=True).encode(), digest_size=8).hexdigest()
+
+
+def detection_key(img_hash, model_path, extra=None):
+    params = {
+        "text_threshold": st_sample.TEXT_THRESHOLD,
+        "low_text": st_sample.LOW_TEXT,
+        "link_threshold": st_sample.LINK_THRESHOLD,
+        "canvas_size": st_sample.CANVAS_SIZE,
+        "mag_ratio": st_sample.MAG_RATIO,
+        "poly": st_sample.POLY,
+        "weights": weights_hash(model_path),
+        "extra": extra
+    }
+    return f"{img_hash}-{_params_hash(params)}"
+
+
+def _model_dir_hash(model_dir):
+    """ Content hash of a Paddle inference model folder (None if unset). """
+    if not model_dir:
+        return None
+    if not os.path.isdir(model_dir):
+        return "missing"
+    return [weights_hash(os.path.join(model_dir, name)) for name in sorted(os.listdir(model_dir))
+            if name.endswith((".pdmodel", ".pdiparams"))]
+
+
+def recognizer_hash(ocr):
+    """ Hash of a PaddleOCR instance's settings and model files, memoized per instance. """
+    if id(ocr) not in _recognizer_hashes:
+        identity = st_Recognition.recognizer_identity(ocr)
+        _recognizer_hashes[id(ocr)] = _params_hash({
+            "identity": identity,
+            "weights": {k: _model_dir_hash(identity[k]) for k in ("det_model_dir", "rec_model_dir", "cls_model_dir")}
+        })
+    return _recognizer_hashes[id(ocr)]
+
+
+def ocr_key(det_key, ocr, extra=None):
+    """ OCR cache key of a ROI: its detection key plus the recognizer identity. """
+    params = {
+        "recognizer": recognizer_hash(ocr),
+        "extra": extra
+    }
+    return f"{det_key}-{_params_hash(params)}"
+
+
+# =========================
+# DISK LRU
+# =========================
+class DiskCache:
+    """
+    Size-bounded key → bytes store on local disk. Reads refresh the file
+    mtime, and eviction removes the least recently used entries until the
+    cache is back under `max_bytes`.
+    """
+
+    def __init__(self, root, max_bytes=CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(root, exist_ok=True)
+        self._size = sum(size for _, size, _ in self._entries())
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def _entries(self):
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if name.endswith(".tmp"):       # another writer's in-flight file
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                yield path, st.st_size, st.st_mtime
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def put(self, key, data):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        try:
+            old_size = os.path.getsize(path)
+        except OSError:
+            old_size = 0
+        os.replace(tmp, path)
+
+        with self._lock:
+            self._size += len(data) - old_size
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        entries = sorted(self._entries(), key=lambda e: e[2])
+        total = sum(size for _, size, _ in entries)
+        target = int(self.max_bytes * 0.9)
+
+        for path, size, _ in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                continue
+        self._size = total
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "bytes": self._size}
+
+
+# =========================
+# RESULT CACHE
+# =========================
+class ResultCache:
+    """ Detection boxes and OCR results, cached separately per ROI. """
+
+    def __init__(self, root=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.det = DiskCache(os.path.join(root, "det"), max_bytes // 2)
+        self.ocr = DiskCache(os.path.join(root, "ocr"), max_bytes // 2)
+
+    def get_boxes(self, key):
+        data = self.det.get(key)
+        if data is None:
+            return None
+        with np.load(io.BytesIO(data)) as npz:
+            if "boxes" in npz.files:        # entries written before polygon support
+                return list(npz["boxes"])
+            npoints = npz["npoints"]
+            if not len(npoints):
+                return []
+            return np.split(npz["points"], np.cumsum(npoints)[:-1])
+
+    def put_boxes(self, key, boxes):
+        """ Quads and (with st_sample.POLY) polygons, as flat points + point counts. """
+        buf = io.BytesIO()
+        pts = [np.asarray(box, dtype=np.float32).reshape(-1, 2) for box in boxes]
+        np.savez_compressed(
+            buf,
+            points=np.concatenate(pts) if pts else np.zeros((0, 2), np.float32),
+            npoints=np.array([len(p) for p in pts], dtype=np.int32)
+        )
+        self.det.put(key, buf.getvalue())
+
+    def get_ocr(self, key):
+        data = self.ocr.get(key)
+        return None if data is None else json.loads(data.decode("utf-8"))
+
+    def put_ocr(self, key, crop_results):
+        self.ocr.put(key, json.dumps(crop_results, ensure_ascii=False).encode("utf-8"))
+
+    def stats(self):
+        return {"det": self.det.stats(), "ocr": self.ocr.stats()}
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def default_cache():
+    """ Process-wide cache, or None when OCR_CACHE=0. """
+    global _default
+    if not CACHE_ENABLED:
+        return None
+    with _default_lock:
+        if _default is None:
+            _default = ResultCache()
+    return _default
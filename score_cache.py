@@ -0,0 +1,77 @@
+import os
+import io
+import numpy as np
+
+import st_sample
+from result_cache import DiskCache, image_hash, weights_hash, _params_hash
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# =========================
+# SCORE MAP STORE SETTINGS
+# =========================
+SCORE_DIR = os.environ.get("OCR_SCORE_DIR", os.path.join(BASE_DIR, ".cache", "scores"))
+SCORE_MAX_BYTES = int(os.environ.get("OCR_SCORE_MAX_MB", 256)) * 1024 * 1024
+
+
+def score_key(image, model_path, extra=None):
+    """
+    Key of the raw CRAFT score maps of an RGB image. Thresholds are not
+    part of it: the same maps serve every TEXT/LINK/LOW threshold.
+    """
+    params = {
+        "canvas_size": st_sample.CANVAS_SIZE,
+        "mag_ratio": st_sample.MAG_RATIO,
+        "weights": weights_hash(model_path),
+        "extra": extra
+    }
+    return f"{image_hash(image)}-{_params_hash(params)}"
+
+
+class ScoreMapStore:
+    """
+    Size-bounded on-disk store of (score_text, score_link, ratio) as
+    uncompressed NPZ: written only by the threshold preview, where a
+    compressed write of an 800×800 pair cost about 300 ms.
+    """
+
+    def __init__(self, root=SCORE_DIR, max_bytes=SCORE_MAX_BYTES):
+        self.store = DiskCache(root, max_bytes)
+
+    def put(self, key, score_text, score_link, target_ratio):
+        buf = io.BytesIO()
+        np.savez(
+            buf,
+            score_text=np.ascontiguousarray(score_text, dtype=np.float32),
+            score_link=np.ascontiguousarray(score_link, dtype=np.float32),
+            target_ratio=np.float64(target_ratio)
+        )
+        self.store.put(key, buf.getvalue())
+
+    def get(self, key):
+        """ Returns {"score_text", "score_link", "target_ratio"} or None. """
+        data = self.store.get(key)
+        if data is None:
+            return None
+        with np.load(io.BytesIO(data)) as npz:
+            return {
+                "score_text": npz["score_text"],
+                "score_link": npz["score_link"],
+                "target_ratio": float(npz["target_ratio"])
+            }
+
+
+def rethreshold(maps, text_threshold=None, link_threshold=None, low_text=None):
+    """
+    Boxes for new thresholds from stored score maps: reruns only
+    getDetBoxes + adjustResultCoordinates, never CRAFT.
+    """
+    ratio = 1 / maps["target_ratio"]
+    boxes = st_sample.get_boxes(
+        maps["score_text"], maps["score_link"], ratio, ratio,
+        text_threshold=text_threshold,
+        link_threshold=link_threshold,
+        low_text=low_text,
+        stage="preview_det_boxes"
+    )
+    return st_sample.sort_boxes_reading_order(boxes)
@@ -0,0 +1,228 @@
+"""
+Headless OCR service (ASGI).
+
+    uvicorn service:app --host 0.0.0.0 --port 8000
+
+POST /ocr   multipart: image=<file>, rois=<optional JSON [[x, y, w, h], ...]>
+            → {"rois": [{"roi", "rect", "rows": [{"text", "rect"}]}]}
+GET /metrics  per-stage latency histograms, peak RSS, cache hits (Prometheus text)
+
+Requests from concurrent callers are queued and run through the pipeline
+together, so one CRAFT/OCR pass covers several callers' ROIs.
+"""
+import os
+import json
+import math
+import time
+import asyncio
+import numpy as np
+import cv2
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, File, Form, HTTPException, UploadFile
+from fastapi.responses import PlainTextResponse
+from starlette.concurrency import run_in_threadpool
+
+import metrics
+import models
+from pipeline import OCRPipeline
+
+# =========================
+# SERVICE SETTINGS
+# =========================
+QUEUE_SIZE = int(os.environ.get("OCR_QUEUE_SIZE", 32))            # pending requests before 503
+MAX_BATCH_ROIS = int(os.environ.get("OCR_MAX_BATCH_ROIS", 16))    # ROIs per pipeline pass
+BATCH_WINDOW_MS = int(os.environ.get("OCR_BATCH_WINDOW_MS", 20))  # wait for more callers
+RETRY_AFTER_S = 1
+
+
+# =========================
+# REQUEST BATCHER
+# =========================
+class BatchScheduler:
+    """
+    Bounded request queue + a single worker that merges queued requests
+    into one `run_job` call (up to MAX_BATCH_ROIS ROIs) and resolves each
+    caller's future with its own ROI results.
+    """
+
+    def __init__(self, pipeline, queue_size=QUEUE_SIZE, max_batch_rois=MAX_BATCH_ROIS,
+                 window_ms=BATCH_WINDOW_MS):
+        self.pipeline = pipeline
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.max_batch_rois = max_batch_rois
+        self.window = window_ms / 1000.0
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._worker())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def submit(self, rois):
+        """ Queues one request's ROIs. Raises asyncio.QueueFull when saturated. """
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((rois, future))
+        return await future
+
+    async def _collect(self):
+        batch = [await self.queue.get()]
+        n_rois = len(batch[0][0])
+        deadline = time.monotonic() + self.window
+
+        while n_rois < self.max_batch_rois:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self.queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            batch.append(item)
+            n_rois += len(item[0])
+
+        return batch
+
+    async def _worker(self):
+        while True:
+            batch = await self._collect()
+
+            job = []
+            for req_idx, (rois, _) in enumerate(batch):
+                for roi_idx, (_, image) in enumerate(rois):
+                    job.append((f"{req_idx}_{roi_idx}", image))
+
+            try:
+                results = await run_in_threadpool(self.pipeline.run_job, job)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            pos = 0
+            for rois, future in batch:
+                if not future.done():
+                    future.set_result(results[pos:pos + len(rois)])
+                pos += len(rois)
+
+
+# =========================
+# HELPERS
+# =========================
+@metrics.timed("decode")
+def decode_image(data):
+    buf = np.frombuffer(data, dtype=np.uint8)
+    image = cv2.imdecode(buf, cv2.IMREAD_COLOR)
+    if image is None:
+        raise HTTPException(status_code=400, detail="Could not decode image")
+    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+
+def _valid_rect(rect):
+    return (
+        isinstance(rect, list) and len(rect) == 4 and
+        all(isinstance(v, (int, float)) and not isinstance(v, bool) and math.isfinite(v) for v in rect)
+    )
+
+
+def parse_rois(rois, image):
+    """ Clips [[x, y, w, h], ...] to the image; no ROIs means the whole image. """
+    img_h, img_w = image.shape[:2]
+    if not rois:
+        return [((0, 0, img_w, img_h), image)]
+
+    try:
+        rects = json.loads(rois)
+    except ValueError:
+        rects = None
+    if not isinstance(rects, list):
+        raise HTTPException(status_code=400, detail="rois must be JSON [[x, y, w, h], ...]")
+
+    out = []
+    for rect in rects:
+        if not _valid_rect(rect):
+            raise HTTPException(status_code=400, detail=f"Bad ROI {rect!r}, expected [x, y, w, h]")
+        x, y, w, h = (int(v) for v in rect)
+        x1, y1 = max(0, x), max(0, y)
+        x2, y2 = min(img_w, x + w), min(img_h, y + h)
+        if x2 <= x1 or y2 <= y1:
+            continue
+        out.append(((x1, y1, x2 - x1, y2 - y1), image[y1:y2, x1:x2]))
+
+    if not out:
+        raise HTTPException(status_code=400, detail="No ROI overlaps the image")
+    return out
+
+
+# =========================
+# APP
+# =========================
+@asynccontextmanager
+async def lifespan(app):
+    # persistent, warmed-up models for the lifetime of the worker
+    net, ocr = models.get_default_craft(), models.get_ocr()
+    app.state.scheduler = BatchScheduler(OCRPipeline(net=net, ocr=ocr))
+    app.state.scheduler.start()
+    yield
+    await app.state.scheduler.stop()
+
+
+app = FastAPI(title="Tyre OCR", lifespan=lifespan)
+
+
+@app.get("/healthz")
+async def healthz():
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+async def readyz():
+    scheduler = app.state.scheduler
+    return {"status": "ready", "queued": scheduler.queue.qsize(), "queue_size": scheduler.queue.maxsize}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+@app.post("/ocr")
+async def ocr(image: UploadFile = File(...), rois: str = Form(None)):
+    # decoding and ROI slicing are CPU-bound: keep them off the event loop
+    rgb = await run_in_threadpool(decode_image, await image.read())
+    rects = await run_in_threadpool(parse_rois, rois, rgb)
+
+    job = [(f"roi_{i:02}", roi) for i, (_, roi) in enumerate(rects, start=1)]
+
+    try:
+        results = await app.state.scheduler.submit(job)
+    except asyncio.QueueFull:
+        raise HTTPException(
+            status_code=503,
+            detail="OCR queue is full",
+            headers={"Retry-After": str(RETRY_AFTER_S)}
+        )
+
+    response = []
+    for i, ((rx, ry, rw, rh), result) in enumerate(zip(rects, results), start=1):
+        response.append({
+            "roi": f"roi_{i:02}",
+            "rect": [rx, ry, rw, rh],
+            "rows": [
+                {
+                    "text": row["text"],
+                    # back to full-image coordinates
+                    "rect": [int(row["rect"][0]) + rx, int(row["rect"][1]) + ry,
+                             int(row["rect"][2]), int(row["rect"][3])]
+                }
+                for row in result["rows"]
+            ]
+        })
+
+    return {"rois": response}
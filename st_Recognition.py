@@ -51,136 +51,128 @@
 #     main()
 
 import os
-import glob
 import sys
-import json
-import cv2
+import paddleocr
 from paddleocr import PaddleOCR
 import numpy as np
 
 
-def main(input_folder=None):
-    # -------------------------------------------------
-    # Resolve input folder
-    # -------------------------------------------------
-    if input_folder is None:
-        if len(sys.argv) > 1:
-            input_folder = sys.argv[1]
-        else:
-            raise ValueError("❌ cropped_boxes path not provided")
-
-    if not os.path.isdir(input_folder):
-        raise RuntimeError(f"❌ Invalid input folder: {input_folder}")
-
+def load_ocr(**kwargs):
     # -------------------------------------------------
     # Initialize PaddleOCR (CLASSIC & STABLE)
+    # extra kwargs go to PaddleOCR (e.g. cpu_threads)
     # -------------------------------------------------
-    ocr = PaddleOCR(
+    # classifier / recognizer rebatch internally (width-sorted)
+    kwargs.setdefault("rec_batch_num", REC_BATCH_SIZE)
+    kwargs.setdefault("cls_batch_num", REC_BATCH_SIZE)
+    return PaddleOCR(
         use_angle_cls=True,
         lang="en",
-        use_gpu=False   # IMPORTANT: CPU only
+        use_gpu=False,  # IMPORTANT: CPU only
+        **kwargs
     )
 
-    # -------------------------------------------------
-    # Output directory
-    # -------------------------------------------------
-    output_folder = os.path.join(input_folder, "output")
-    os.makedirs(output_folder, exist_ok=True)
 
-    # -------------------------------------------------
-    # Read cropped images
-    # -------------------------------------------------
-    image_paths = []
-    for ext in ("*.jpg", "*.png", "*.jpeg"):
-        image_paths.extend(
-            glob.glob(os.path.join(input_folder, ext))   # 🔥 NO recursive
-        )
+def recognizer_identity(ocr):
+    """
+    Settings that decide what `ocr` outputs: PaddleOCR version, language,
+    model / dictionary paths and score cut-off. Model files themselves are
+    hashed by the caller (see `result_cache.ocr_key`).
+    """
+    args = getattr(ocr, "args", None)
+    identity = {
+        "paddleocr": getattr(paddleocr, "__version__", None),
+        "use_angle_cls": getattr(ocr, "use_angle_cls", None),
+        "drop_score": getattr(ocr, "drop_score", None),
+    }
+    for name in ("lang", "ocr_version", "det_model_dir", "rec_model_dir", "cls_model_dir",
+                 "rec_char_dict_path", "rec_algorithm", "rec_image_shape"):
+        identity[name] = getattr(args, name, None)
+    return identity
+
+
+def parse_ocr_result(results):
+    """
+    Flattens a PaddleOCR `ocr()` result into
+    [{"text", "confidence", "box"}, ...]. Returns None when
+    PaddleOCR returned nothing at all.
+    """
+    if results is None:
+        return None
+
+    ocr_json = []
+    for line in results:
+        if line is None:
+            print("⚠️ No text detected in this crop")
+            continue
 
-    # 🔥 VERY IMPORTANT: Remove already OCR-processed images
-    image_paths = [
-        p for p in image_paths
-        if "_ocr" not in os.path.basename(p)
-    ]
+        for box, (text, score) in line:
+            ocr_json.append({
+                "text": text,
+                "confidence": float(score),
+                "box": box
+            })
 
+    return ocr_json
 
-    if not image_paths:
-        print(f"⚠️ No crop images found in {input_folder}, skipping OCR")
-        return
 
+def recognize_crop(ocr, img):
+    return parse_ocr_result(ocr.ocr(img, cls=True))
 
-    # -------------------------------------------------
-    # OCR loop
-    # -------------------------------------------------
-    for image_path in image_paths:
-        file_name = os.path.splitext(os.path.basename(image_path))[0]
-        print(f"🔍 Running OCR on: {file_name}")
 
-        img = cv2.imread(image_path)
-        if img is None:
-            print(f"⚠️ Failed to read image: {image_path}")
-            continue
+# -------------------------------------------------
+# Recognition-only batch mode
+# -------------------------------------------------
+# CRAFT crops are already localized, so PaddleOCR's own detector is
+# skipped and crops go straight to the angle classifier + recognizer.
+# Skipping detection changes results on crops holding several words or
+# lines, so it is opt-in (OCR_REC_ONLY=1).
+REC_ONLY = os.environ.get("OCR_REC_ONLY", "0") != "0"
+REC_BATCH_SIZE = int(os.environ.get("OCR_REC_BATCH_SIZE", 16))
+
 
-        results = ocr.ocr(img, cls=True)
+def recognize_batch(ocr, images):
+    """
+    Recognizes single-line crops without PaddleOCR detection.
+    All crops go to the angle classifier and recognizer in one call;
+    both sort by aspect ratio and batch `cls_batch_num` / `rec_batch_num`
+    (REC_BATCH_SIZE, see `load_ocr`) at a time internally.
+    Returns one `parse_ocr_result`-style list per image, in input order.
+    """
+    results = [[] for _ in images]
+    if not images:
+        return results
+    drop_score = getattr(ocr, "drop_score", 0.5)
 
-        # ---- prepare outputs ----
-        vis_path = os.path.join(output_folder, f"{file_name}_ocr.jpg")
-        json_path = os.path.join(output_folder, f"{file_name}_ocr.json")
+    batch = list(images)
+    if ocr.use_angle_cls:
+        batch, _, _ = ocr.text_classifier(batch)
 
-        ocr_json = []
-        vis_img = img.copy()
+    rec_res, _ = ocr.text_recognizer(batch)
 
-        # -------------------------------------------------
-        # Parse OCR results
-        # -------------------------------------------------
-        if results is None:
-            print("⚠️ No OCR result returned")
+    for i, (text, score) in enumerate(rec_res):
+        if not text or score < drop_score:
             continue
 
-        for line in results:
-            if line is None:
-                print("⚠️ No text detected in this crop")
-                continue
-
-            for box, (text, score) in line:
-                ocr_json.append({
-                    "text": text,
-                    "confidence": float(score),
-                    "box": box
-                })
-
-                pts = [(int(x), int(y)) for x, y in box]
-                cv2.polylines(
-                    vis_img,
-                    [cv2.convexHull(
-                        np.array(pts)
-                    )],
-                    True,
-                    (0, 255, 0),
-                    2
-                )
-
-                cv2.putText(
-                    vis_img,
-                    text,
-                    pts[0],
-                    cv2.FONT_HERSHEY_SIMPLEX,
-                    0.5,
-                    (0, 0, 255),
-                    1,
-                    cv2.LINE_AA
-                )
-
-
-        # -------------------------------------------------
-        # Save outputs
-        # -------------------------------------------------
-        cv2.imwrite(vis_path, vis_img)
-
-        with open(json_path, "w", encoding="utf-8") as f:
-            json.dump(ocr_json, f, indent=2, ensure_ascii=False)
-
-        print(f"✅ Saved OCR image: {vis_path}")
-        print(f"✅ Saved OCR JSON : {json_path}")
+        h, w = images[i].shape[:2]
+        results[i].append({
+            "text": text,
+            "confidence": float(score),
+            "box": [[0, 0], [w, 0], [w, h], [0, h]]
+        })
+
+    return results
+
+
+def main():
+    # The crop-folder mode wrote OCR results that no later step reads: CRAFT
+    # boxes are not recoverable from crop files, and st_apo_restich needs
+    # the job store that only the full pipeline (ArtifactSink) writes.
+    sys.exit(
+        "st_Recognition.py has no standalone mode: run `python st_sample.py <input_dir>` "
+        "(detection + OCR + restitch, writes <input_dir>/job_results.npz), then "
+        "`python st_apo_restich.py <input_dir>` to restitch again."
+    )
 
 
 if __name__ == "__main__":
@@ -1,189 +1,184 @@
 import os
-import json
+import heapq
 import cv2
 import numpy as np
-import pandas as pd
 
 import sys
+from job_store import JOB_STORE_NAME, load_job, job_rois
+import table_sinks
 
-if len(sys.argv) > 1:
-    BASE_INPUT_DIR = sys.argv[1]
-else:
-    raise ValueError("❌ INPUT_DIR not provided to apo_restich.py")
-
-IMAGES_FOLDER = BASE_INPUT_DIR
-MAPPING_FOLDER = os.path.join(BASE_INPUT_DIR, "cropped_boxes")
-OCR_FOLDER = os.path.join(BASE_INPUT_DIR, "cropped_boxes", "output")
-STITCHED_FOLDER = os.path.join(BASE_INPUT_DIR, "stitched")
-
-os.makedirs(STITCHED_FOLDER, exist_ok=True)
-
-
-os.makedirs(STITCHED_FOLDER, exist_ok=True)
-
-print("🧵 Restitching OCR text into words and lines...")
 
 # =========================
 # GROUPING FUNCTION
 # =========================
-def group_by_line_and_gap(crops, y_thresh=50, min_x_gap=120, scale_gap=2.5):
+def box_rects(boxes):
     """
-    Groups OCR crops into proper words/lines using
-    vertical alignment + dynamic horizontal gap.
+    int32 point arrays of a list of boxes, plus the (N, 4) array of their
+    cv2.boundingRect-style (x, y, w, h), computed in one pass for quads.
     """
+    if not boxes:
+        return [], np.zeros((0, 4), dtype=np.int64)
 
-    annotated = []
-    for crop in crops:
-        box = np.array(crop["box"], dtype=np.int32)
-        x, y, w, h = cv2.boundingRect(box)
-        annotated.append((x, y, w, h, crop["text"], box))
-
-    # Sort top → bottom
-    annotated.sort(key=lambda b: b[1])
+    try:
+        pts = np.array(boxes, dtype=np.int32).reshape(len(boxes), -1, 2)
+    except ValueError:     # ragged polygons
+        pts = [np.asarray(b, dtype=np.int32) for b in boxes]
+        return pts, np.array([cv2.boundingRect(p) for p in pts], dtype=np.int64)
 
-    # ---- Group by text line ----
-    rows, current_row = [], []
-    for item in annotated:
-        if not current_row:
-            current_row.append(item)
-        else:
-            _, y0, _, _, *_ = current_row[0]
-            _, y1, _, _, *_ = item
-            if abs(y1 - y0) <= y_thresh:
-                current_row.append(item)
-            else:
-                rows.append(current_row)
-                current_row = [item]
-    if current_row:
-        rows.append(current_row)
-
-    # ---- Merge words inside each line ----
-    final_groups = []
+    lo, hi = pts.min(axis=1), pts.max(axis=1)
+    return list(pts), np.column_stack([lo, hi - lo + 1]).astype(np.int64)
 
-    for row in rows:
-        row.sort(key=lambda b: b[0])  # left → right
 
-        avg_char_width = np.mean([
-            w / max(len(text), 1) for x, y, w, h, text, _ in row
-        ])
-        x_gap_thresh = max(min_x_gap, int(avg_char_width * scale_gap))
-
-        group, prev_x, prev_w = [], None, None
-
-        for item in row:
-            x, y, w, h, text, box = item
-            if prev_x is None:
-                group = [item]
-            else:
-                gap = x - (prev_x + prev_w)
-                if gap <= x_gap_thresh:
-                    group.append(item)
-                else:
-                    final_groups.append(group)
-                    group = [item]
-            prev_x, prev_w = x, w
-
-        if group:
-            final_groups.append(group)
-
-    return final_groups
-
-# =========================
-# MAIN PROCESS
-# =========================
-
-excel_rows = []
+def group_lines(rects, min_overlap=0.5, y_thresh=50):
+    """
+    Clusters (x, y, w, h) rects into text lines by vertical overlap.
 
-for file in os.listdir(MAPPING_FOLDER):
-    if not file.endswith("_mapping.json"):
-        continue
+    Rects are swept top → bottom against an interval index of the open
+    lines, ordered by their bottom edge: lines ending above the current
+    top are closed for good, so each rect is compared only with the few
+    lines it can still overlap. A rect joins the open line whose mean
+    y-extent it overlaps most, if that overlap is at least `min_overlap`
+    of the smaller height and the tops are within `y_thresh`.
 
-    base_name = file.replace("_mapping.json", "")
-    mapping_path = os.path.join(MAPPING_FOLDER, file)
-    image_path = None
-    for ext in (".jpg", ".png", ".jpeg"):
-        p = os.path.join(IMAGES_FOLDER, base_name + ext)
-        if os.path.exists(p):
-            image_path = p
-            break
+    Returns lists of rect indices, one per line, in top → bottom order.
+    """
+    order = np.argsort(rects[:, 1], kind="stable").tolist()
+    tops = rects[:, 1].tolist()
+    heights = rects[:, 3].tolist()
+
+    lines = []          # [indices, sum_top, sum_bottom, max bottom]
+    open_heap = []      # (max bottom, line id), stale entries skipped
+    active = set()
+
+    for i in order:
+        h = heights[i]
+        top, bottom = tops[i], tops[i] + h
+
+        while open_heap and open_heap[0][0] < top:
+            line_bottom, line_id = heapq.heappop(open_heap)
+            if line_bottom == lines[line_id][3]:
+                active.discard(line_id)
+
+        best, best_overlap = None, 0.0
+        for line_id in active:
+            indices, sum_top, sum_bottom, _ = lines[line_id]
+            n = len(indices)
+            line_top, line_bottom = sum_top / n, sum_bottom / n
+
+            overlap = min(bottom, line_bottom) - max(top, line_top)
+            ratio = overlap / max(min(h, line_bottom - line_top), 1)
+            if ratio >= min_overlap and abs(top - line_top) <= y_thresh and ratio > best_overlap:
+                best, best_overlap = line_id, ratio
+
+        if best is None:
+            best = len(lines)
+            lines.append([[], 0, 0, bottom])
+            active.add(best)
+
+        line = lines[best]
+        line[0].append(i)
+        line[1] += top
+        line[2] += bottom
+        if bottom >= line[3] or len(line[0]) == 1:
+            line[3] = bottom
+            heapq.heappush(open_heap, (bottom, best))
+
+    return [indices for indices, _, _, _ in lines]
+
+
+def group_by_line_and_gap(crops, y_thresh=50, min_x_gap=120, scale_gap=2.5, min_overlap=0.5):
+    """
+    Groups OCR crops into proper words/lines using
+    vertical overlap (`group_lines`) + dynamic horizontal gap.
+    """
+    boxes, rects = box_rects([crop["box"] for crop in crops])
+    texts = [crop["text"] for crop in crops]
+    n_chars = np.array([max(len(t), 1) for t in texts])
+    rect_list = rects.tolist()
 
-    if image_path is None:
-        print(f"⚠️ Missing image for {base_name}")
-        continue
+    final_groups = []
 
-    if not os.path.exists(image_path):
-        print(f"⚠️ Missing image: {image_path}")
-        continue
+    for line in group_lines(rects, min_overlap, y_thresh):
+        line = np.asarray(line)
+        line = line[np.argsort(rects[line, 0], kind="stable")]   # left → right
 
-    image = cv2.imread(image_path)
+        avg_char_width = float(np.mean(rects[line, 2] / n_chars[line]))
+        x_gap_thresh = max(min_x_gap, int(avg_char_width * scale_gap))
 
-    with open(mapping_path, "r") as jf:
-        mapping = json.load(jf)
+        # split wherever the gap to the previous box is too wide
+        x, w = rects[line, 0], rects[line, 2]
+        gaps = x[1:] - (x[:-1] + w[:-1])
+        cuts = (np.nonzero(gaps > x_gap_thresh)[0] + 1).tolist()
 
-    valid_crops = []
+        items = [(*rect_list[i], texts[i], boxes[i]) for i in line.tolist()]
+        for a, b in zip([0] + cuts, cuts + [len(items)]):
+            final_groups.append(items[a:b])
 
-    for crop in mapping["crops"]:
-        crop_file = crop["file"]
-        ocr_json = os.path.join(
-            OCR_FOLDER,
-            f"{os.path.splitext(crop_file)[0]}_ocr.json"
-        )
+    return final_groups
 
-        if not os.path.exists(ocr_json):
-            continue
 
-        with open(ocr_json, "r") as ojf:
-            ocr_data = json.load(ojf)
+def restitch(crops, **kwargs):
+    """
+    In-memory restitch: [{"box", "text"}, ...] → [{"text", "rect"}, ...]
+    (keyword arguments go to `group_by_line_and_gap`).
+    """
+    if not crops:
+        return []
+    return stitch_groups(group_by_line_and_gap(crops, **kwargs))
 
-        texts = []
 
-        if isinstance(ocr_data, list):
-            for item in ocr_data:
-                t = item.get("text", "").strip()   # ← FIXED HERE
-                if t:
-                    texts.append(t)
+# =========================
+# RESTITCH HELPERS
+# =========================
+def ocr_texts(ocr_data):
+    texts = []
 
-        elif isinstance(ocr_data, dict):
-            t = ocr_data.get("text", "").strip()  # ← FIXED HERE
+    if isinstance(ocr_data, list):
+        for item in ocr_data:
+            t = item.get("text", "").strip()   # ← FIXED HERE
             if t:
                 texts.append(t)
 
-        for text in texts:
-            valid_crops.append({
-                "box": crop["box"],
-                "text": text
-            })
+    elif isinstance(ocr_data, dict):
+        t = ocr_data.get("text", "").strip()  # ← FIXED HERE
+        if t:
+            texts.append(t)
 
+    return texts
 
 
-    # ---- Group and restitch ----
-    groups = group_by_line_and_gap(valid_crops)
-    if not valid_crops:
-        continue
+def stitch_groups(groups):
+    """
+    Merges every group from `group_by_line_and_gap` into one text line.
+    Returns [{"text", "rect": (x, y, w, h)}, ...] in reading order.
+    """
+    stitched = []
 
-    # ---- Draw stitched text ----
     for group in groups:
-        boxes = [item[5] for item in group]
         texts = [item[4] for item in group]
 
-        all_pts = np.vstack(boxes).astype(np.int32)
-        x, y, w, h = cv2.boundingRect(all_pts)
-
-        merged_text = " ".join(texts)
+        # union of the per-box bounding rects == bounding rect of all points
+        x = min(item[0] for item in group)
+        y = min(item[1] for item in group)
+        w = max(item[0] + item[2] for item in group) - x
+        h = max(item[1] + item[3] for item in group) - y
 
-        excel_rows.append({
-            "image": base_name,
-            "text": merged_text,
-            # "x": int(x),
-            # "y": int(y),
-            # "w": int(w),
-            # "h": int(h)
+        stitched.append({
+            "text": " ".join(texts),
+            "rect": (x, y, w, h)
         })
 
+    return stitched
+
+
+def draw_stitched(image, stitched):
+    for row in stitched:
+        x, y, w, h = row["rect"]
+
         cv2.rectangle(image, (x, y), (x + w, y + h), (0, 255, 0), 2)
- 
+
         # === USE EXACT SAME TEXT AS EXCEL ===
-        text_to_draw = merged_text
+        text_to_draw = row["text"]
 
         # Font scale from box height
         font_scale = max(0.4, min(1.0, h / 30))
@@ -223,20 +218,90 @@ for file in os.listdir(MAPPING_FOLDER):
             cv2.LINE_AA
         )
 
-    out_img = os.path.join(STITCHED_FOLDER, base_name + "_stitched.jpg")
-    cv2.imwrite(out_img, image)
-    print(f"✅ Saved stitched image: {out_img}")
+    return image
+
 
 # =========================
-# SAVE EXCEL
+# MAIN PROCESS
 # =========================
-if excel_rows:
-    df = pd.DataFrame(excel_rows)
-    excel_path = os.path.join(STITCHED_FOLDER, "stitched_output.xlsx")
-    df.to_excel(excel_path, index=False)
-    print(f"📊 Excel saved: {excel_path}")
-else:
-    print("⚠️ No text found, Excel not created")
+def main(base_input_dir=None, table_format=table_sinks.TABLE_FORMAT, render_viz=False):
+    if base_input_dir is None:
+        args = [a for a in sys.argv[1:] if not a.startswith("--")]
+        render_viz = render_viz or "--viz" in sys.argv[1:]
+        if args:
+            base_input_dir = args[0]
+        else:
+            raise ValueError("❌ INPUT_DIR not provided to apo_restich.py")
+
+    images_folder = base_input_dir
+    store_path = os.path.join(base_input_dir, JOB_STORE_NAME)
+    stitched_folder = os.path.join(base_input_dir, "stitched")
+
+    if not os.path.exists(store_path):
+        raise ValueError(f"❌ No {JOB_STORE_NAME} in {base_input_dir}")
+
+    os.makedirs(stitched_folder, exist_ok=True)
+
+    print("🧵 Restitching OCR text into words and lines...")
+
+    excel_rows = []
+
+    # one bulk load for every box / OCR text of the job
+    for roi in job_rois(load_job(store_path)):
+        base_name = roi["name"]
+
+        valid_crops = [
+            {"box": crop["box"], "text": text}
+            for crop in roi["crops"]
+            for text in ocr_texts(crop["ocr"])
+        ]
+
+        if not valid_crops:
+            continue
+
+        # ---- Group and restitch ----
+        stitched = restitch(valid_crops)
+
+        for row in stitched:
+            excel_rows.append({
+                "image": base_name,
+                "text": row["text"],
+            })
+
+        if not render_viz:
+            continue
+
+        # ---- Draw stitched text (on request only) ----
+        image_path = None
+        for ext in (".jpg", ".png", ".jpeg"):
+            p = os.path.join(images_folder, base_name + ext)
+            if os.path.exists(p):
+                image_path = p
+                break
+
+        if image_path is None:
+            print(f"⚠️ Missing image for {base_name}")
+            continue
+
+        image = cv2.imread(image_path)
+        draw_stitched(image, stitched)
+
+        out_img = os.path.join(stitched_folder, base_name + "_stitched.jpg")
+        cv2.imwrite(out_img, image)
+        print(f"✅ Saved stitched image: {out_img}")
+
+    # =========================
+    # SAVE TABLE
+    # =========================
+    if excel_rows:
+        with table_sinks.open_table_sink(stitched_folder, fmt=table_format) as table:
+            table.write(excel_rows)
+    else:
+        print("⚠️ No text found, table not created")
+
+    print("🎉 Restitching completed.")
+    return excel_rows
 
 
-print("🎉 Restitching completed.")
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,15 @@
 import os
-import json
 import torch
 import torch.backends.cudnn as cudnn
 import numpy as np
 import cv2
 from collections import OrderedDict
-from torch.autograd import Variable
 
 import craft_utils
 import imgproc
+import metrics
+from buffer_pool import detect_pool
 from craft import CRAFT
-import subprocess
 import sys
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -19,14 +18,10 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 # PATHS (EDIT IF NEEDED)
 # =========================
 # INPUT_DIR = r"C:\Users\DELL\Downloads\CRAFT-pytorch-master (2)\CRAFT-pytorch-master\sample"     # input images (.jpg)
-# ===== CLI INPUT =====
-if len(sys.argv) > 1:
-    INPUT_DIR = sys.argv[1]
-else:
-    raise ValueError("INPUT_DIR not provided")
-
-CROP_OUTPUT_DIR = os.path.join(INPUT_DIR, "cropped_boxes")
 CRAFT_MODEL_PATH = os.path.join(BASE_DIR, "craft_mlt_25k.pth")
+QUANT_MODEL_PATH = os.path.join(BASE_DIR, "craft_mlt_25k_int8.pt")   # built by craft_quant.py
+TS_MODEL_PATH = os.path.join(BASE_DIR, "craft_mlt_25k_ts.pt")        # built by craft_backend.py
+ONNX_MODEL_PATH = os.path.join(BASE_DIR, "craft_mlt_25k.onnx")       # built by craft_backend.py
 RESULT_DIR = os.path.join(BASE_DIR, "sample_result")
 
 
@@ -42,6 +37,8 @@ CANVAS_SIZE = 1600
 MAG_RATIO = 1.8
 USE_CUDA = torch.cuda.is_available()
 POLY = False
+QUANTIZED = False       # use the INT8 CRAFT from QUANT_MODEL_PATH (CPU only)
+DETECT_BACKEND = "torch"    # "torch" | "torchscript" | "onnx" (see craft_backend.py)
 
 
 def copyStateDict(state_dict):
@@ -52,40 +49,304 @@ def copyStateDict(state_dict):
     return new_state_dict
 
 
-def test_net(net, image):
-    img_resized, target_ratio, _ = imgproc.resize_aspect_ratio(
+def input_shape(image, canvas_size=CANVAS_SIZE, mag_ratio=MAG_RATIO):
+    """ NCHW shape of the CRAFT input for `image` (32-aligned). """
+    _, _, target_h32, target_w32, _ = imgproc.target_geometry(image.shape[0], image.shape[1], canvas_size, mag_ratio)
+    return 1, 3, target_h32, target_w32
+
+
+def score_shape(in_shape):
+    """ (N, 2, H/2, W/2) score-map buffer shape for an NCHW input shape. """
+    return in_shape[0], 2, in_shape[2] // 2, in_shape[3] // 2
+
+
+@metrics.timed("preprocess")
+def prepare_input(image, canvas_size=CANVAS_SIZE, mag_ratio=MAG_RATIO, out=None):
+    """
+    Resizes, pads and normalizes `image` in one go into a contiguous
+    (1, 3, H, W) tensor. `out` (shape `input_shape(...)`, e.g. borrowed from
+    `detect_pool`) is filled in place instead of allocating a new array.
+    """
+    if out is None:
+        out = np.empty(input_shape(image, canvas_size, mag_ratio), dtype=np.float32)
+
+    target_ratio, _ = imgproc.resize_normalize_into(
         image,
-        CANVAS_SIZE,
+        out[0],
+        canvas_size,
         interpolation=cv2.INTER_LINEAR,
-        mag_ratio=MAG_RATIO
+        mag_ratio=mag_ratio
     )
 
-    ratio_h = ratio_w = 1 / target_ratio
-
-    x = imgproc.normalizeMeanVariance(img_resized)
-    x = torch.from_numpy(x).permute(2, 0, 1)
-    x = Variable(x.unsqueeze(0))
-
-    if USE_CUDA:
-        x = x.cuda()
+    return torch.from_numpy(out), target_ratio
+
+
+@metrics.timed("craft_forward")
+def forward_net(net, x, out=None):
+    """
+    Runs CRAFT on an NCHW float32 batch and returns the (N, H/2, W/2, 2)
+    score maps as numpy. `net` is either an eager CRAFT module or a
+    detection backend from `craft_backend` (anything with `infer`).
+    With `out`, a float32 (N, 2, H/2, W/2) buffer, the maps are copied
+    into it channel-first (contiguous per map) and `out` is returned.
+    """
+    if hasattr(net, "infer"):
+        y = net.infer(x)
+        if out is None:
+            return y
+        np.copyto(out, y.transpose(0, 3, 1, 2))
+        return out
+
+    # the net's own device, not USE_CUDA: CPU-pinned nets (batch workers,
+    # INT8, `craft_quant check`) run on CPU hosts and GPU hosts alike
+    x = x.to(net_device(net))
 
     with torch.no_grad():
         y, _ = net(x)
 
-    score_text = y[0, :, :, 0].cpu().numpy()
-    score_link = y[0, :, :, 1].cpu().numpy()
+    if out is None:
+        return y.cpu().numpy()
 
-    boxes, _ = craft_utils.getDetBoxes(
-        score_text,
-        score_link,
-        TEXT_THRESHOLD,
-        LINK_THRESHOLD,
-        LOW_TEXT,
-        POLY
-    )
+    # device → pooled host buffer without an intermediate .cpu() copy
+    torch.from_numpy(out).copy_(y.permute(0, 3, 1, 2))
+    return out
+
+
+def test_net(net, image, canvas_size=CANVAS_SIZE, mag_ratio=MAG_RATIO):
+    in_shape = input_shape(image, canvas_size, mag_ratio)
+
+    with detect_pool.borrow(in_shape) as buf, detect_pool.borrow(score_shape(in_shape)) as scores:
+        x, target_ratio = prepare_input(image, canvas_size, mag_ratio, out=buf)
+
+        ratio_h = ratio_w = 1 / target_ratio
+
+        forward_net(net, x, out=scores)
+
+        score_text = scores[0, 0]
+        score_link = scores[0, 1]
+
+        return get_boxes(score_text, score_link, ratio_w, ratio_h)
+
+
+def get_boxes(score_text, score_link, ratio_w, ratio_h,
+              text_threshold=None, link_threshold=None, low_text=None, stage="get_det_boxes"):
+    """
+    Boxes in image coordinates: (4, 2) quads, or with POLY the curved
+    polygons of getPoly_core, falling back to the quad where it gives none.
+    Timed under `stage`, so threshold previews stay out of the detection
+    latency of real runs.
+    """
+    with metrics.timed(stage):
+        boxes, polys = craft_utils.getDetBoxes(
+            score_text,
+            score_link,
+            TEXT_THRESHOLD if text_threshold is None else text_threshold,
+            LINK_THRESHOLD if link_threshold is None else link_threshold,
+            LOW_TEXT if low_text is None else low_text,
+            POLY
+        )
+
+        boxes = craft_utils.adjustResultCoordinates(boxes, ratio_w, ratio_h)
+        if not POLY:
+            return boxes
+
+        # polygons have different point counts: scale them one by one
+        return [
+            box if poly is None else craft_utils.adjustResultCoordinates([np.float32(poly)], ratio_w, ratio_h)[0]
+            for box, poly in zip(boxes, polys)
+        ]
+
+
+# -------------------------
+# Batched detection
+# -------------------------
+BATCH_BUCKET = 128      # bucket granularity (px, multiple of 32)
+MAX_BATCH = 8           # max images per forward pass
+MAX_BATCH_PIXELS = CANVAS_SIZE * CANVAS_SIZE    # padded input pixels per forward pass
+
+
+def _bucket_shape(h, w, bucket=BATCH_BUCKET):
+    return -(-h // bucket) * bucket, -(-w // bucket) * bucket
+
+
+def _batch_chunks(indices, shapes, max_batch=MAX_BATCH, max_pixels=MAX_BATCH_PIXELS):
+    """
+    Splits `indices` into chunks of at most `max_batch` images whose
+    padded size (count × the largest member's 32-aligned H and W) stays
+    within `max_pixels`. An image larger than the budget runs alone.
+    """
+    chunks, chunk, chunk_h, chunk_w = [], [], 0, 0
+    for i in indices:
+        h, w = shapes[i]
+        grown_h, grown_w = max(chunk_h, h), max(chunk_w, w)
+        if chunk and (len(chunk) == max_batch or (len(chunk) + 1) * grown_h * grown_w > max_pixels):
+            chunks.append((chunk, chunk_h, chunk_w))
+            chunk, grown_h, grown_w = [], h, w
+        chunk.append(i)
+        chunk_h, chunk_w = grown_h, grown_w
+    if chunk:
+        chunks.append((chunk, chunk_h, chunk_w))
+    return chunks
+
+
+def test_net_batch(net, images, bucket=BATCH_BUCKET, max_batch=MAX_BATCH, max_pixels=MAX_BATCH_PIXELS):
+    """
+    Runs CRAFT on several images, grouping them by shape bucket. Each
+    forward pass holds at most `max_batch` images and `max_pixels` padded
+    input pixels, and is padded only to the largest 32-aligned canvas
+    among its images (a lone image runs at exactly its `test_net` shape).
+    Images are resized and normalized directly into the NCHW batch; score
+    maps are cropped back per image. Returns the list of boxes per image,
+    in input order.
+    """
+    geometry = [None] * len(images)
+    shapes = [None] * len(images)
+    buckets = {}
+    for i, image in enumerate(images):
+        _, _, target_h32, target_w32, _ = imgproc.target_geometry(
+            image.shape[0], image.shape[1], CANVAS_SIZE, MAG_RATIO
+        )
+        shapes[i] = (target_h32, target_w32)
+        buckets.setdefault(_bucket_shape(target_h32, target_w32, bucket), []).append(i)
+
+    results = [None] * len(images)
+
+    for indices in buckets.values():
+        for chunk, chunk_h, chunk_w in _batch_chunks(indices, shapes, max_batch, max_pixels):
+            in_shape = (len(chunk), 3, chunk_h, chunk_w)
+            with detect_pool.borrow(in_shape) as batch, detect_pool.borrow(score_shape(in_shape)) as scores:
+                # padding up to the chunk shape is normalized zero, like the 32-px canvas
+                for b, i in enumerate(chunk):
+                    with metrics.timed("preprocess"):
+                        geometry[i] = imgproc.resize_normalize_into(
+                            images[i],
+                            batch[b],
+                            CANVAS_SIZE,
+                            interpolation=cv2.INTER_LINEAR,
+                            mag_ratio=MAG_RATIO
+                        )
+
+                forward_net(net, torch.from_numpy(batch), out=scores)
 
-    boxes = craft_utils.adjustResultCoordinates(boxes, ratio_w, ratio_h)
-    return boxes
+                for b, i in enumerate(chunk):
+                    target_ratio, (heat_w, heat_h) = geometry[i]
+                    ratio_h = ratio_w = 1 / target_ratio
+
+                    score_text = scores[b, 0, :heat_h, :heat_w]
+                    score_link = scores[b, 1, :heat_h, :heat_w]
+                    results[i] = get_boxes(score_text, score_link, ratio_w, ratio_h)
+
+    return results
+
+
+# -------------------------
+# Tiled detection (large images)
+# -------------------------
+TILE_SIZE = 1280        # tile side at native resolution (px)
+TILE_OVERLAP = 256      # overlap between neighbouring tiles (px)
+TILE_MAG_RATIO = 1.0    # tiles are not downsampled to CANVAS_SIZE
+TILE_TRIGGER = 4000     # images with a longer side than this are tiled
+
+
+def _tile_starts(length, tile_size, overlap):
+    if length <= tile_size:
+        return [0]
+    stride = tile_size - overlap
+    starts = list(range(0, length - tile_size, stride))
+    starts.append(length - tile_size)
+    return starts
+
+
+def _order_box(box):
+    startidx = box.sum(axis=1).argmin()
+    return np.roll(box, 4-startidx, 0)
+
+
+def merge_seam_boxes(boxes, tile_ids, seam):
+    """
+    Merges boxes from different tiles whose bounding rects intersect.
+    Only boxes flagged in `seam` (touching a tile overlap band) take part;
+    each merged group becomes the min-area box of all its points.
+    """
+    parent = list(range(len(boxes)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    cand = [i for i in range(len(boxes)) if seam[i]]
+    rects = {i: cv2.boundingRect(np.asarray(boxes[i], dtype=np.float32)) for i in cand}
+    cand.sort(key=lambda i: rects[i][0])     # sweep left → right
+
+    for a_pos, a in enumerate(cand):
+        ax, ay, aw, ah = rects[a]
+        for b in cand[a_pos + 1:]:
+            bx, by, bw, bh = rects[b]
+            if bx > ax + aw:
+                break
+            if tile_ids[a] == tile_ids[b]:
+                continue
+            if by <= ay + ah and ay <= by + bh:
+                parent[find(b)] = find(a)
+
+    groups = OrderedDict()
+    for i in range(len(boxes)):
+        groups.setdefault(find(i), []).append(i)
+
+    merged = []
+    for members in groups.values():
+        if len(members) == 1:
+            merged.append(boxes[members[0]])
+            continue
+        pts = np.vstack([boxes[i] for i in members]).astype(np.float32)
+        merged.append(_order_box(cv2.boxPoints(cv2.minAreaRect(pts))))
+
+    return merged
+
+
+def test_net_tiled(net, image, tile_size=TILE_SIZE, overlap=TILE_OVERLAP, mag_ratio=TILE_MAG_RATIO):
+    """
+    Runs CRAFT over overlapping native-resolution tiles of `image` and
+    merges boxes cut by tile seams. Peak memory depends on the tile
+    size only, not on the input size.
+    """
+    img_h, img_w = image.shape[:2]
+    canvas_size = int(tile_size * mag_ratio)
+
+    boxes, tile_ids, seam = [], [], []
+    ys = _tile_starts(img_h, tile_size, overlap)
+    xs = _tile_starts(img_w, tile_size, overlap)
+
+    tile_id = 0
+    for row, ty in enumerate(ys):
+        for col, tx in enumerate(xs):
+            tile = image[ty:ty + tile_size, tx:tx + tile_size]
+
+            # overlap bands shared with a neighbour tile, from the neighbour's
+            # real extent (the last tile is clamped and may overlap far more)
+            band_l = min(xs[col - 1] + tile_size, img_w) if col > 0 else None
+            band_t = min(ys[row - 1] + tile_size, img_h) if row > 0 else None
+            band_r = xs[col + 1] if col + 1 < len(xs) else None
+            band_b = ys[row + 1] if row + 1 < len(ys) else None
+
+            for box in test_net(net, tile, canvas_size=canvas_size, mag_ratio=mag_ratio):
+                box = box + np.array([tx, ty], dtype=np.float32)
+                x, y, w, h = cv2.boundingRect(box.astype(np.float32))
+
+                boxes.append(box)
+                tile_ids.append(tile_id)
+                seam.append(
+                    (band_l is not None and x < band_l) or
+                    (band_t is not None and y < band_t) or
+                    (band_r is not None and x + w > band_r) or
+                    (band_b is not None and y + h > band_b)
+                )
+
+            tile_id += 1
+
+    return merge_seam_boxes(boxes, tile_ids, seam)
 
 
 # -------------------------
@@ -235,108 +496,123 @@ def sort_boxes_reading_order(boxes, vertical_thresh=30):
 #     print("\n🎉 FULL PIPELINE COMPLETED SUCCESSFULLY")
 
 
-def main():
+def net_device(net):
+    """ Device of an eager CRAFT's weights (CPU for parameterless INT8 nets). """
+    param = next(net.parameters(), None)
+    return torch.device("cpu") if param is None else param.device
+
+
+def default_model_path(quantized=False, backend="torch"):
+    if quantized:
+        return QUANT_MODEL_PATH
+    if backend == "torchscript":
+        return TS_MODEL_PATH
+    if backend == "onnx":
+        return ONNX_MODEL_PATH
+    return CRAFT_MODEL_PATH
 
-    os.makedirs(CROP_OUTPUT_DIR, exist_ok=True)
-    os.makedirs(RESULT_DIR, exist_ok=True)
 
-    device = torch.device("cuda" if USE_CUDA and torch.cuda.is_available() else "cpu")
-    if not os.path.exists(CRAFT_MODEL_PATH):
-        raise FileNotFoundError(f"CRAFT model not found at {CRAFT_MODEL_PATH}")
+def load_craft(model_path=CRAFT_MODEL_PATH, use_cuda=USE_CUDA, quantized=False, backend="torch"):
+    if quantized:
+        import craft_quant
+        return craft_quant.load_quantized_craft(model_path)
+
+    if backend != "torch":
+        import craft_backend
+        return craft_backend.load_backend(backend, model_path, use_cuda)
+
+    device = torch.device("cuda" if use_cuda and torch.cuda.is_available() else "cpu")
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(f"CRAFT model not found at {model_path}")
 
     net = CRAFT()
     net.load_state_dict(
-        copyStateDict(torch.load(CRAFT_MODEL_PATH, map_location=device))
+        copyStateDict(torch.load(model_path, map_location=device))
     )
 
-    if USE_CUDA:
+    if use_cuda:
         net = torch.nn.DataParallel(net).cuda()
     net.eval()
 
     print("CRAFT loaded")
+    return net
 
-    image_list = [
-        os.path.join(INPUT_DIR, f)
-        for f in os.listdir(INPUT_DIR)
-        if f.lower().endswith((".jpg", ".png", ".jpeg"))
-    ]
-    if not image_list:
-        raise RuntimeError(f"No images found in {INPUT_DIR}")
-
-    for idx_img, image_path in enumerate(image_list, start=1):
-        print(f"[{idx_img}/{len(image_list)}] Processing {image_path}")
-
-        image = imgproc.loadImage(image_path)
-        image_bgr = cv2.imread(image_path)
-        orig_image = image_bgr.copy()
-        filename = os.path.splitext(os.path.basename(image_path))[0]
-
-        boxes = test_net(net, image)
-        boxes = sort_boxes_reading_order(boxes)
-
-        mapping = {"image": os.path.basename(image_path), "crops": []}
 
-        for idx, box in enumerate(boxes, start=1):
-            box = box.astype(np.int32)
-            x, y, w, h = cv2.boundingRect(box)
-
-            if w < 20 or h < 20:
-                continue
+# -------------------------
+# Crop extraction
+# -------------------------
+@metrics.timed("crop")
+def extract_crops(image, boxes, min_size=20):
+    """
+    Cuts the axis-aligned crop of every box out of `image`.
+    Returns a list of dicts with the 1-based reading-order index,
+    the int32 quad, its clipped rect (x1, y1, x2, y2) and the crop view.
+    """
+    crops = []
+    img_h, img_w = image.shape[:2]
+
+    for idx, box in enumerate(boxes, start=1):
+        box = np.asarray(box).astype(np.int32)
+        x, y, w, h = cv2.boundingRect(box)
 
-            x1 = max(x, 0)
-            y1 = max(y, 0)
-            x2 = min(x + w, orig_image.shape[1])
-            y2 = min(y + h, orig_image.shape[0])
-
-            crop = orig_image[y1:y2, x1:x2]
-            crop_name = f"{filename}_box{idx:03}.jpg"
-            crop_path = os.path.join(CROP_OUTPUT_DIR, crop_name)
-            cv2.imwrite(crop_path, crop)
-
-            mapping["crops"].append({
-                "file": crop_name,
-                "box": box.tolist(),
-                "index": idx
-            })
-
-            cv2.polylines(image_bgr, [box.reshape(-1, 1, 2)], True, (0, 255, 0), 2)
-            cv2.putText(
-                image_bgr, str(idx),
-                (x, y - 10),
-                cv2.FONT_HERSHEY_SIMPLEX,
-                0.8, (0, 0, 255), 2
-            )
-
-        cv2.imwrite(
-            os.path.join(RESULT_DIR, f"{filename}_result.jpg"),
-            image_bgr
+        # skip noise
+        if w < min_size or h < min_size:
+            continue
+
+        x1 = max(x, 0)
+        y1 = max(y, 0)
+        x2 = min(x + w, img_w)
+        y2 = min(y + h, img_h)
+
+        crops.append({
+            "index": idx,
+            "box": box,
+            "rect": (x1, y1, x2, y2),
+            "image": image[y1:y2, x1:x2]
+        })
+
+    metrics.count("boxes", len(boxes))
+    return crops
+
+
+def draw_detections(image, crops):
+    for crop in crops:
+        box = crop["box"]
+        x, y = crop["rect"][:2]
+
+        cv2.polylines(image, [box.reshape(-1, 1, 2)], True, (0, 255, 0), 2)
+        cv2.putText(
+            image, str(crop["index"]),
+            (x, y - 10),
+            cv2.FONT_HERSHEY_SIMPLEX,
+            0.8, (0, 0, 255), 2
         )
 
-        with open(
-            os.path.join(CROP_OUTPUT_DIR, f"{filename}_mapping.json"),
-            "w"
-        ) as jf:
-            json.dump(mapping, jf, indent=4)
+    return image
 
 
-    print("Step 1: CRAFT done")
+def main(input_dir=None):
+    # ===== CLI INPUT =====
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    quantized = QUANTIZED or "--int8" in sys.argv[1:]
+    render_viz = "--viz" in sys.argv[1:]     # detection / stitched overlays (preview size)
+    backend = DETECT_BACKEND
+    for a in sys.argv[1:]:
+        if a.startswith("--backend="):
+            backend = a.split("=", 1)[1]
 
-    subprocess.run([
-        sys.executable,
-        os.path.join(BASE_DIR, "st_Recognition.py"),
-        CROP_OUTPUT_DIR
-    ], check=True)
+    if input_dir is None:
+        if args:
+            input_dir = args[0]
+        else:
+            raise ValueError("INPUT_DIR not provided")
 
-    print("OCR done")
+    from pipeline import OCRPipeline
 
-    subprocess.run([
-        sys.executable,
-        os.path.join(BASE_DIR, "st_apo_restich.py"),
-        INPUT_DIR
-    ], check=True)
+    OCRPipeline(quantized=quantized, backend=backend).run_dir(input_dir, render_viz=render_viz or None)
 
     print("FULL PIPELINE DONE")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,139 @@
+import os
+import csv
+import json
+from io import BytesIO
+import pandas as pd
+
+# =========================
+# TABLE OUTPUT SETTINGS
+# =========================
+TABLE_FORMAT = os.environ.get("OCR_TABLE_FORMAT", "csv")    # csv | jsonl | parquet | xlsx
+TABLE_COLUMNS = ["image", "text"]
+
+
+# =========================
+# SINKS
+# =========================
+class TableSink:
+    """
+    Appends [{"image", "text"}, ...] row batches to one output table.
+    `write` can be called once per image as results stream in; `close`
+    finalizes the file. Usable as a context manager.
+    """
+    ext = None
+
+    def __init__(self, path, columns=TABLE_COLUMNS):
+        self.path = path
+        self.columns = list(columns)
+        self.rows_written = 0
+
+    def write(self, rows):
+        rows = list(rows)
+        if rows:
+            self._write(rows)
+            self.rows_written += len(rows)
+
+    def _write(self, rows):
+        raise NotImplementedError
+
+    def close(self):
+        print(f"📊 {self.rows_written} row(s) saved: {self.path}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class CSVSink(TableSink):
+    ext = "csv"
+
+    def __init__(self, path, columns=TABLE_COLUMNS):
+        super().__init__(path, columns)
+        self._f = open(path, "w", encoding="utf-8", newline="")
+        self._writer = csv.DictWriter(self._f, fieldnames=self.columns, extrasaction="ignore")
+        self._writer.writeheader()
+
+    def _write(self, rows):
+        self._writer.writerows(rows)
+        self._f.flush()
+
+    def close(self):
+        self._f.close()
+        super().close()
+
+
+class JSONLSink(TableSink):
+    ext = "jsonl"
+
+    def __init__(self, path, columns=TABLE_COLUMNS):
+        super().__init__(path, columns)
+        self._f = open(path, "w", encoding="utf-8")
+
+    def _write(self, rows):
+        for row in rows:
+            self._f.write(json.dumps({k: row.get(k) for k in self.columns}, ensure_ascii=False) + "\n")
+        self._f.flush()
+
+    def close(self):
+        self._f.close()
+        super().close()
+
+
+class ParquetSink(TableSink):
+    """ One Parquet row group per `write`. Needs pyarrow (imported on use). """
+    ext = "parquet"
+
+    def __init__(self, path, columns=TABLE_COLUMNS):
+        super().__init__(path, columns)
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("Parquet output needs pyarrow: pip install pyarrow") from e
+
+        self._pa = pa
+        self._schema = pa.schema([(c, pa.string()) for c in self.columns])
+        self._writer = pq.ParquetWriter(path, self._schema)
+
+    def _write(self, rows):
+        data = {c: [None if row.get(c) is None else str(row[c]) for row in rows] for c in self.columns}
+        self._writer.write_table(self._pa.Table.from_pydict(data, schema=self._schema))
+
+    def close(self):
+        self._writer.close()
+        super().close()
+
+
+class ExcelSink(TableSink):
+    """ Excel cannot be appended to: rows are buffered and written on close. """
+    ext = "xlsx"
+
+    def __init__(self, path, columns=TABLE_COLUMNS):
+        super().__init__(path, columns)
+        self._rows = []
+
+    def _write(self, rows):
+        self._rows.extend(rows)
+
+    def close(self):
+        pd.DataFrame(self._rows, columns=self.columns).to_excel(self.path, index=False)
+        super().close()
+
+
+SINKS = {cls.ext: cls for cls in (CSVSink, JSONLSink, ParquetSink, ExcelSink)}
+
+
+def open_table_sink(out_dir, name="stitched_output", fmt=TABLE_FORMAT, columns=TABLE_COLUMNS):
+    """ Opens <out_dir>/<name>.<fmt> with the sink registered for `fmt`. """
+    if fmt not in SINKS:
+        raise ValueError(f"❌ Unknown table format {fmt!r} (expected one of {sorted(SINKS)})")
+    return SINKS[fmt](os.path.join(out_dir, f"{name}.{fmt}"), columns)
+
+
+def excel_bytes(df):
+    """ In-memory .xlsx of a DataFrame, for on-demand downloads. """
+    buf = BytesIO()
+    df.to_excel(buf, index=False)
+    return buf.getvalue()
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("torch")
+import st_sample
+
+
+def test_chunks_respect_pixel_budget():
+    shapes = [(1600, 544)] * 8
+    chunks = st_sample._batch_chunks(range(8), shapes, max_batch=8, max_pixels=1600 * 1600)
+    assert [len(c) for c, _, _ in chunks] == [2, 2, 2, 2]
+    assert all(len(c) * h * w <= 1600 * 1600 for c, h, w in chunks)
+
+
+def test_oversized_image_runs_alone():
+    shapes = [(1600, 1600), (320, 320), (320, 320)]
+    chunks = st_sample._batch_chunks(range(3), shapes, max_batch=8, max_pixels=1000 * 1000)
+    assert chunks == [([0], 1600, 1600), ([1, 2], 320, 320)]
+
+
+def test_chunk_is_padded_to_largest_member_not_bucket(monkeypatch):
+    seen = []
+
+    def forward_net(net, x, out=None):
+        seen.append(tuple(x.shape))
+        out[...] = 0
+        return out
+
+    monkeypatch.setattr(st_sample, "forward_net", forward_net)
+    monkeypatch.setattr(st_sample, "MAG_RATIO", 1.0)
+    image = np.zeros((384, 1088, 3), np.uint8)
+
+    st_sample.test_net_batch(None, [image])
+
+    assert seen == [st_sample.input_shape(image, st_sample.CANVAS_SIZE, 1.0)] == [(1, 3, 384, 1088)]
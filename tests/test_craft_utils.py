@@ -0,0 +1,138 @@
+import math
+
+import cv2
+import numpy as np
+import pytest
+
+import craft_utils
+
+
+def _random_box(rng, size):
+    """ A rotated rectangle partly or fully inside a `size`×`size` map. """
+    center = rng.uniform(-20, size + 20, 2)
+    dims = rng.uniform(3, size / 2, 2)
+    box = cv2.boxPoints((tuple(center), tuple(dims), rng.uniform(-90, 90)))
+    w, h = (int(np.linalg.norm(box[0] - box[1]) + 1), int(np.linalg.norm(box[1] - box[2]) + 1))
+    dst = np.float32([[0, 0], [w, 0], [w, h], [0, h]])
+    return cv2.getPerspectiveTransform(box, dst), cv2.getPerspectiveTransform(dst, box), w, h
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_warp_label_matches_full_map_warp(seed):
+    rng = np.random.default_rng(seed)
+    labels = rng.integers(0, 6, (160, 160)).astype(np.int32)
+    scratch = np.zeros(labels.shape, np.uint8)
+
+    for _ in range(50):
+        label = int(rng.integers(1, 6))
+        M, Minv, w, h = _random_box(rng, 160)
+        expected = cv2.warpPerspective((labels == label).astype(np.uint8), M, (w, h), flags=cv2.INTER_NEAREST)
+
+        got = craft_utils.warpLabel(labels, label, M, Minv, w, h, scratch)
+
+        if got is None:
+            assert not expected.any()
+        else:
+            np.testing.assert_array_equal(got, expected)
+        assert not scratch.any()
+
+
+def _reference_det_boxes(textmap, linkmap, text_threshold, link_threshold, low_text):
+    """ Upstream CRAFT getDetBoxes_core, verbatim apart from formatting. """
+    linkmap = linkmap.copy()
+    textmap = textmap.copy()
+    img_h, img_w = textmap.shape
+
+    ret, text_score = cv2.threshold(textmap, low_text, 1, 0)
+    ret, link_score = cv2.threshold(linkmap, link_threshold, 1, 0)
+
+    text_score_comb = np.clip(text_score + link_score, 0, 1)
+    nLabels, labels, stats, centroids = cv2.connectedComponentsWithStats(text_score_comb.astype(np.uint8), connectivity=4)
+
+    det = []
+    mapper = []
+    for k in range(1, nLabels):
+        size = stats[k, cv2.CC_STAT_AREA]
+        if size < 10: continue
+
+        if np.max(textmap[labels == k]) < text_threshold: continue
+
+        segmap = np.zeros(textmap.shape, dtype=np.uint8)
+        segmap[labels == k] = 255
+        segmap[np.logical_and(link_score == 1, text_score == 0)] = 0
+        x, y = stats[k, cv2.CC_STAT_LEFT], stats[k, cv2.CC_STAT_TOP]
+        w, h = stats[k, cv2.CC_STAT_WIDTH], stats[k, cv2.CC_STAT_HEIGHT]
+        niter = int(math.sqrt(size * min(w, h) / (w * h)) * 2)
+        sx, ex, sy, ey = x - niter, x + w + niter + 1, y - niter, y + h + niter + 1
+        if sx < 0: sx = 0
+        if sy < 0: sy = 0
+        if ex >= img_w: ex = img_w
+        if ey >= img_h: ey = img_h
+        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (1 + niter, 1 + niter))
+        segmap[sy:ey, sx:ex] = cv2.dilate(segmap[sy:ey, sx:ex], kernel)
+
+        np_contours = np.roll(np.array(np.where(segmap != 0)), 1, axis=0).transpose().reshape(-1, 2)
+        rectangle = cv2.minAreaRect(np_contours)
+        box = cv2.boxPoints(rectangle)
+
+        w, h = np.linalg.norm(box[0] - box[1]), np.linalg.norm(box[1] - box[2])
+        box_ratio = max(w, h) / (min(w, h) + 1e-5)
+        if abs(1 - box_ratio) <= 0.1:
+            l, r = min(np_contours[:, 0]), max(np_contours[:, 0])
+            t, b = min(np_contours[:, 1]), max(np_contours[:, 1])
+            box = np.array([[l, t], [r, t], [r, b], [l, b]], dtype=np.float32)
+
+        startidx = box.sum(axis=1).argmin()
+        box = np.roll(box, 4 - startidx, 0)
+        box = np.array(box)
+
+        det.append(box)
+        mapper.append(k)
+
+    return det, labels, mapper
+
+
+def _noisy_maps(rng, h=256, w=256):
+    """ Blurred noise: many irregular components, touching the borders. """
+    maps = []
+    for _ in range(2):
+        m = cv2.GaussianBlur(rng.random((h, w)).astype(np.float32), (0, 0), 3)
+        maps.append((m - m.min()) / (m.max() - m.min()))
+    return maps
+
+
+def _word_maps(rng, h=240, w=320):
+    """ Chains of character blobs joined by link strokes, straight or curved. """
+    text, link = np.zeros((h, w), np.float32), np.zeros((h, w), np.float32)
+    for _ in range(rng.integers(3, 9)):
+        x, y = rng.integers(20, w - 20), rng.integers(15, h - 15)
+        angle, bend = rng.uniform(-0.4, 0.4), rng.uniform(-0.15, 0.15)
+        step, r = rng.uniform(6, 14), int(rng.uniform(4, 8))
+        for i in range(rng.integers(3, 9)):
+            nx, ny = x + step * np.cos(angle), y + step * np.sin(angle)
+            cv2.circle(text, (int(nx), int(ny)), r, 0.9, -1)
+            cv2.line(link, (int(x), int(y)), (int(nx), int(ny)), 0.8, r)
+            x, y, angle = nx, ny, angle + bend
+    return cv2.GaussianBlur(text, (0, 0), 2), cv2.GaussianBlur(link, (0, 0), 2)
+
+
+@pytest.mark.parametrize("make_maps, thresholds", [
+    (_noisy_maps, (0.6, 0.6, 0.5)),
+    (_noisy_maps, (0.7, 0.4, 0.4)),
+    (_word_maps, (0.7, 0.4, 0.4)),
+])
+def test_det_boxes_match_reference(make_maps, thresholds):
+    rng = np.random.default_rng(0)
+    for _ in range(20):
+        textmap, linkmap = make_maps(rng)
+        # batched detection hands in strided views of the score buffer
+        textmap, linkmap = np.pad(textmap, ((0, 3), (0, 5)))[:-3, :-5], np.pad(linkmap, ((0, 3), (0, 5)))[:-3, :-5]
+
+        boxes, labels, mapper = craft_utils.getDetBoxes_core(textmap, linkmap, *thresholds)
+        ref_boxes, ref_labels, ref_mapper = _reference_det_boxes(textmap, linkmap, *thresholds)
+
+        assert mapper == ref_mapper
+        np.testing.assert_array_equal(labels, ref_labels)
+        assert len(boxes) == len(ref_boxes)
+        for box, ref_box in zip(boxes, ref_boxes):
+            np.testing.assert_array_equal(box, ref_box)
@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+
+torch = pytest.importorskip("torch")
+import st_sample
+
+
+class _CpuNet(torch.nn.Module):
+    """ CRAFT stand-in that records the device its input arrives on. """
+
+    def __init__(self):
+        super().__init__()
+        self.weight = torch.nn.Parameter(torch.zeros(1))
+
+    def forward(self, x):
+        self.seen = x.device
+        n, _, h, w = x.shape
+        return torch.zeros(n, h // 2, w // 2, 2), None
+
+
+def test_cpu_net_keeps_input_on_cpu_when_cuda_is_on(monkeypatch):
+    # `craft_quant check` and the batch workers load CRAFT with use_cuda=False
+    monkeypatch.setattr(st_sample, "USE_CUDA", True)
+    net = _CpuNet()
+
+    out = np.empty((1, 2, 32, 32), np.float32)
+    st_sample.forward_net(net, torch.zeros(1, 3, 64, 64), out=out)
+
+    assert net.seen.type == "cpu"
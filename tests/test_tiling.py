@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("torch")
+import st_sample
+
+
+def _fake_detector(word):
+    """ test_net stand-in: returns `word` (x1, y1, x2, y2) wherever a tile fully contains it. """
+    x1, y1, x2, y2 = word
+
+    def detect(offsets):
+        def test_net(net, tile, canvas_size=None, mag_ratio=None):
+            tx, ty = offsets.pop(0)
+            th, tw = tile.shape[:2]
+            if tx <= x1 and x2 <= tx + tw and ty <= y1 and y2 <= ty + th:
+                return [np.float32([[x1 - tx, y1 - ty], [x2 - tx, y1 - ty], [x2 - tx, y2 - ty], [x1 - tx, y2 - ty]])]
+            return []
+        return test_net
+
+    return detect
+
+
+@pytest.mark.parametrize("img_h", [1500, 1300])
+def test_word_in_clamped_last_tile_overlap_is_merged(monkeypatch, img_h):
+    # last row starts at img_h - 1280, overlapping the first row by far
+    # more than TILE_OVERLAP; the word sits in that extra overlap
+    img_w, word = 6000, (500, 600, 800, 640)
+    image = np.zeros((img_h, img_w, 3), np.uint8)
+
+    ys = st_sample._tile_starts(img_h, st_sample.TILE_SIZE, st_sample.TILE_OVERLAP)
+    xs = st_sample._tile_starts(img_w, st_sample.TILE_SIZE, st_sample.TILE_OVERLAP)
+    offsets = [(tx, ty) for ty in ys for tx in xs]
+    monkeypatch.setattr(st_sample, "test_net", _fake_detector(word)(offsets))
+
+    boxes = st_sample.test_net_tiled(None, image)
+
+    assert len(boxes) == 1
+    xs_, ys_ = np.asarray(boxes[0])[:, 0], np.asarray(boxes[0])[:, 1]
+    assert (xs_.min(), ys_.min(), xs_.max(), ys_.max()) == pytest.approx(word, abs=1)
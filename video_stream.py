@@ -0,0 +1,302 @@
+"""
+Frame-stream OCR for conveyor video / cameras.
+
+    python video_stream.py <video file | camera index> --out rows.csv
+
+Every frame is cut to the scanner strip (same geometry as the mobile
+strip in app.py). CRAFT runs only on keyframes: every KEYFRAME_INTERVAL
+frames, or when the strip changes more than the estimated conveyor shift
+explains. In between, boxes are carried along by that shift (phase
+correlation on a downscaled strip). Each tracked text region collects
+confidence-weighted OCR votes across frames, and regions whose crop has
+not changed since their last recognition are not sent to OCR again.
+"""
+import argparse
+from collections import defaultdict
+import cv2
+import numpy as np
+import pandas as pd
+
+import crop_cache
+from pipeline import OCRPipeline
+
+# =========================
+# STREAM SETTINGS
+# =========================
+KEYFRAME_INTERVAL = 15       # frames between forced CRAFT passes (0 = motion only)
+MOTION_WIDTH = 320           # strip width for shift / motion estimation
+MOTION_THRESHOLD = 12.0      # mean abs residual (0-255) after shift → keyframe
+TRACK_IOU = 0.3              # min IoU to match a detection to a track
+MAX_MISSED = 2               # keyframes a track may go undetected
+CROP_CHANGE_BITS = 10        # crop hash distance that triggers re-recognition
+
+
+def strip_rect(img_w, img_h, orientation="Horizontal", thickness_pct=22, pos_pct=50):
+    """ Scanner strip (x1, y1, x2, y2) in image pixels. """
+    thickness = int((thickness_pct / 100.0) * (img_h if orientation == "Horizontal" else img_w))
+    thickness = max(12, thickness)
+    pos = pos_pct / 100.0
+
+    if orientation == "Horizontal":
+        cy = int(pos * img_h)
+        return 0, max(0, cy - thickness // 2), img_w, min(img_h, cy + thickness // 2)
+
+    cx = int(pos * img_w)
+    return max(0, cx - thickness // 2), 0, min(img_w, cx + thickness // 2), img_h
+
+
+def _rect(box):
+    x, y, w, h = cv2.boundingRect(np.asarray(box, dtype=np.float32))
+    return x, y, x + w, y + h
+
+
+def _iou(a, b):
+    ix = max(0, min(a[2], b[2]) - max(a[0], b[0]))
+    iy = max(0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = ix * iy
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+# =========================
+# TRACKS
+# =========================
+class TextTrack:
+    """ One text region followed across frames, with its OCR votes. """
+
+    def __init__(self, track_id, box, frame_idx):
+        self.track_id = track_id
+        self.box = np.asarray(box, dtype=np.float32)
+        self.first_seen = frame_idx
+        self.missed = 0
+        self.hash = None             # crop hash at the last recognition
+        self.votes = defaultdict(float)
+        self.reads = 0
+
+    def vote(self, ocr_json):
+        self.reads += 1
+        for item in ocr_json or []:
+            self.votes[item["text"]] += item["confidence"]
+
+    @property
+    def text(self):
+        if not self.votes:
+            return ""
+        return max(self.votes.items(), key=lambda kv: kv[1])[0]
+
+    @property
+    def score(self):
+        total = sum(self.votes.values())
+        return self.votes[self.text] / total if total else 0.0
+
+
+class FrameStreamOCR:
+    """
+    Stateful per-stream OCR. Feed RGB frames in order to `process`; read
+    the aggregated text per tracked region from `tracks` / `rows()`.
+    """
+
+    def __init__(self, pipeline=None, strip=("Horizontal", 22, 50),
+                 keyframe_interval=KEYFRAME_INTERVAL, motion_threshold=MOTION_THRESHOLD):
+        # per-frame detections must not fill the disk caches
+        self.pipeline = pipeline or OCRPipeline(use_cache=False, crop_ocr_cache=crop_cache.default_crop_cache())
+        self.strip = strip
+        self.keyframe_interval = keyframe_interval
+        self.motion_threshold = motion_threshold
+
+        self.tracks = []
+        self.finished = []
+        self.frame_idx = -1
+        self.last_keyframe = 0
+        self.stats = {"frames": 0, "keyframes": 0, "recognized": 0, "skipped": 0}
+
+        self._prev_small = None
+        self._scale = 1.0
+        self._next_id = 1
+
+    # -------------------------
+    # Motion
+    # -------------------------
+    def _small(self, strip_rgb):
+        gray = cv2.cvtColor(strip_rgb, cv2.COLOR_RGB2GRAY)
+        self._scale = min(1.0, MOTION_WIDTH / gray.shape[1])
+        return np.float32(cv2.resize(gray, None, fx=self._scale, fy=self._scale, interpolation=cv2.INTER_AREA))
+
+    def _motion(self, small):
+        """ (dx, dy) shift in strip pixels and the residual not explained by it. """
+        prev = self._prev_small
+        if prev is None or prev.shape != small.shape:
+            return (0.0, 0.0), float("inf")
+
+        (dx, dy), _ = cv2.phaseCorrelate(prev, small)
+        warp = np.float32([[1, 0, dx], [0, 1, dy]])
+        moved = cv2.warpAffine(prev, warp, prev.shape[::-1], borderMode=cv2.BORDER_REPLICATE)
+
+        m = int(max(abs(dx), abs(dy))) + 1     # ignore the border exposed by the shift
+        residual = float(np.abs(moved[m:-m, m:-m] - small[m:-m, m:-m]).mean()) if min(small.shape) > 2 * m else 0.0
+        return (dx / self._scale, dy / self._scale), residual
+
+    # -------------------------
+    # Tracking
+    # -------------------------
+    def _associate(self, boxes):
+        rects = [_rect(b) for b in boxes]
+        pairs = sorted(
+            ((_iou(_rect(t.box), r), ti, di) for ti, t in enumerate(self.tracks) for di, r in enumerate(rects)),
+            reverse=True
+        )
+
+        used_t, used_d = set(), set()
+        for iou, ti, di in pairs:
+            if iou < TRACK_IOU:
+                break
+            if ti in used_t or di in used_d:
+                continue
+            self.tracks[ti].box = np.asarray(boxes[di], dtype=np.float32)
+            self.tracks[ti].missed = 0
+            used_t.add(ti)
+            used_d.add(di)
+
+        for ti, track in enumerate(self.tracks):
+            if ti not in used_t:
+                track.missed += 1
+
+        for di, box in enumerate(boxes):
+            if di not in used_d:
+                self.tracks.append(TextTrack(self._next_id, box, self.frame_idx))
+                self._next_id += 1
+
+    def _retire(self, strip_w, strip_h):
+        alive = []
+        for track in self.tracks:
+            x1, y1, x2, y2 = _rect(track.box)
+            gone = x2 <= 0 or y2 <= 0 or x1 >= strip_w or y1 >= strip_h
+            if gone or track.missed > MAX_MISSED:
+                if track.reads:
+                    self.finished.append(track)
+            else:
+                alive.append(track)
+        self.tracks = alive
+
+    # -------------------------
+    # Frame step
+    # -------------------------
+    def process(self, frame_rgb):
+        """ Advances the stream by one RGB frame. Returns the strip (RGB) and keyframe flag. """
+        self.frame_idx += 1
+        self.stats["frames"] += 1
+
+        img_h, img_w = frame_rgb.shape[:2]
+        x1, y1, x2, y2 = strip_rect(img_w, img_h, *self.strip)
+        strip = frame_rgb[y1:y2, x1:x2]
+
+        small = self._small(strip)
+        (dx, dy), residual = self._motion(small)
+        self._prev_small = small
+
+        for track in self.tracks:
+            track.box += (dx, dy)
+
+        keyframe = (
+            residual > self.motion_threshold
+            or (self.keyframe_interval and self.frame_idx - self.last_keyframe >= self.keyframe_interval)
+        )
+        if keyframe:
+            self.last_keyframe = self.frame_idx
+            self.stats["keyframes"] += 1
+            self._associate(self.pipeline.detect(strip))
+
+        self._retire(strip.shape[1], strip.shape[0])
+        self._recognize(strip)
+        return strip, keyframe
+
+    def _recognize(self, strip_rgb):
+        strip_bgr = cv2.cvtColor(strip_rgb, cv2.COLOR_RGB2BGR)
+        crops = self.pipeline.crop(strip_bgr, [t.box for t in self.tracks])
+
+        todo = []
+        for crop in crops:
+            track = self.tracks[crop["index"] - 1]
+            h = crop_cache.crop_hash(crop["image"])
+            if track.hash is not None and np.unpackbits(track.hash ^ h).sum() <= CROP_CHANGE_BITS:
+                self.stats["skipped"] += 1
+                continue
+            track.hash = h
+            todo.append((track, crop))
+
+        if not todo:
+            return
+
+        self.pipeline.recognize([crop for _, crop in todo])
+        for track, crop in todo:
+            track.vote(crop["ocr"])
+        self.stats["recognized"] += len(todo)
+
+    def rows(self, min_reads=1):
+        """ Aggregated reading per text region seen so far, oldest first. """
+        tracks = sorted(self.finished + [t for t in self.tracks if t.reads], key=lambda t: t.track_id)
+        return [
+            {"track": t.track_id, "first_frame": t.first_seen, "text": t.text,
+             "agreement": round(t.score, 3), "reads": t.reads}
+            for t in tracks
+            if t.reads >= min_reads and t.text
+        ]
+
+    def draw(self, strip_rgb):
+        viz = strip_rgb.copy()
+        for track in self.tracks:
+            box = track.box.astype(np.int32)
+            cv2.polylines(viz, [box.reshape(-1, 1, 2)], True, (0, 255, 0), 2)
+            x, y = _rect(track.box)[:2]
+            cv2.putText(viz, f"{track.track_id}:{track.text}", (x, max(y - 6, 10)),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 0, 0), 1, cv2.LINE_AA)
+        return viz
+
+
+def read_frames(source, step=1):
+    """ Yields RGB frames from a video path or camera index. """
+    cap = cv2.VideoCapture(int(source) if str(source).isdigit() else source)
+    if not cap.isOpened():
+        raise ValueError(f"❌ Could not open video source: {source}")
+
+    try:
+        idx = 0
+        while True:
+            ok, frame = cap.read()
+            if not ok:
+                break
+            if idx % step == 0:
+                yield cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            idx += 1
+    finally:
+        cap.release()
+
+
+# =========================
+# MAIN
+# =========================
+def main():
+    parser = argparse.ArgumentParser(description="OCR over a video file or camera stream")
+    parser.add_argument("source", help="video path or camera index")
+    parser.add_argument("--out", default="video_ocr.csv")
+    parser.add_argument("--orientation", choices=["Horizontal", "Vertical"], default="Horizontal")
+    parser.add_argument("--thickness", type=int, default=22, help="strip thickness (%%)")
+    parser.add_argument("--pos", type=int, default=50, help="strip position (%%)")
+    parser.add_argument("--step", type=int, default=1, help="process every n-th frame")
+    parser.add_argument("--keyframe-interval", type=int, default=KEYFRAME_INTERVAL)
+    args = parser.parse_args()
+
+    stream = FrameStreamOCR(
+        strip=(args.orientation, args.thickness, args.pos),
+        keyframe_interval=args.keyframe_interval
+    )
+    for frame in read_frames(args.source, args.step):
+        stream.process(frame)
+
+    df = pd.DataFrame(stream.rows(), columns=["track", "first_frame", "text", "agreement", "reads"])
+    df.to_csv(args.out, index=False)
+    print(f"📊 {len(df)} text region(s) → {args.out}  {stream.stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+import os
+import time
+import uuid
+import shutil
+import threading
+from contextlib import contextmanager
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# =========================
+# WORKSPACE SETTINGS
+# =========================
+WORKSPACE_ROOT = os.environ.get("OCR_WORKSPACE_ROOT", os.path.join(BASE_DIR, "jobs"))
+WORKSPACE_TTL = int(os.environ.get("OCR_WORKSPACE_TTL", 3600))          # seconds
+MAX_CONCURRENT_JOBS = int(os.environ.get("OCR_MAX_CONCURRENT_JOBS", 2))
+
+_job_slots = threading.BoundedSemaphore(MAX_CONCURRENT_JOBS)
+
+
+class JobBusyError(RuntimeError):
+    pass
+
+
+# =========================
+# JOB WORKSPACE
+# =========================
+class JobWorkspace:
+    """
+    A private directory per job under WORKSPACE_ROOT, so concurrent
+    jobs never share or delete each other's files. Layout mirrors the
+    old global one: <job>/ holds the ROIs and <job>/sample_result/ the
+    detection visualizations.
+    """
+
+    def __init__(self, root=WORKSPACE_ROOT):
+        self.job_id = time.strftime("%Y%m%d-%H%M%S") + "-" + uuid.uuid4().hex[:8]
+        self.path = os.path.join(root, self.job_id)
+        self.result_dir = os.path.join(self.path, "sample_result")
+
+        os.makedirs(self.result_dir, exist_ok=True)
+
+    def cleanup(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.cleanup()
+
+
+def cleanup_expired(root=WORKSPACE_ROOT, ttl=WORKSPACE_TTL):
+    """ Removes job workspaces not modified for `ttl` seconds. Returns how many. """
+    if not os.path.isdir(root):
+        return 0
+
+    now = time.time()
+    removed = 0
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if not os.path.isdir(path):
+            continue
+        try:
+            if now - os.path.getmtime(path) > ttl:
+                shutil.rmtree(path, ignore_errors=True)
+                removed += 1
+        except OSError:
+            continue     # removed concurrently
+
+    return removed
+
+
+# =========================
+# CONCURRENCY LIMITER
+# =========================
+@contextmanager
+def job_slot(timeout=None):
+    """
+    Holds one of MAX_CONCURRENT_JOBS process-wide slots for the duration
+    of a job. Blocks up to `timeout` seconds (forever if None) and raises
+    JobBusyError when no slot frees up in time.
+    """
+    if not _job_slots.acquire(timeout=timeout):
+        raise JobBusyError(f"All {MAX_CONCURRENT_JOBS} job slots are busy")
+    try:
+        yield
+    finally:
+        _job_slots.release()